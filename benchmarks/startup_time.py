@@ -0,0 +1,96 @@
+"""Startup-time benchmark for the CLI scripts.
+
+Runs each script's module-level code (its imports and constants, not its __main__ block) in
+a fresh interpreter with `python -X importtime`, reports the slowest imports, and fails if
+the budget is blown or a heavy module gets imported at module level. Imports inside the
+__main__ block aren't measured, so those should come after the script's prompts.
+
+From the root of the repo:
+    python benchmarks/startup_time.py
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = [
+    os.path.join(ROOT_DIR, "load_to_db", "load_to_db.py"),
+    os.path.join(ROOT_DIR, "load_to_s3", "load_to_staging_s3.py"),
+]
+# These should only ever be imported by the stage that needs them
+HEAVY_MODULES = ["pandas", "numpy", "pandera", "sqlalchemy", "boto3", "git"]
+DEFAULT_BUDGET_SECONDS = 0.5
+RUNS = 5
+
+
+def parse_importtime(stderr: str) -> list:
+    """Turns `-X importtime` output into a list of (cumulative_us, module) tuples"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        imports.append((int(cumulative), module.strip()))
+
+    return imports
+
+
+def time_script_startup(script: str) -> Tuple:
+    """Runs the module-level code of `script` (not its __main__ block) and times it"""
+    # A run_name other than "__main__" executes the module-level imports but skips the
+    # __main__ block (and everything it imports)
+    # The script's own directory goes on sys.path, as it would when run directly
+    code = (
+        f"import runpy, sys; sys.path.insert(0, {os.path.dirname(script)!r}); "
+        f"runpy.run_path({script!r}, run_name='startup_benchmark')"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"'{script}' failed to start:\n{result.stderr}")
+
+    return elapsed, parse_importtime(result.stderr)
+
+
+def main(budget: float, runs: int) -> int:
+    failed = False
+    for script in SCRIPTS:
+        timings = []
+        for _ in range(runs):
+            elapsed, imports = time_script_startup(script)
+            timings.append(elapsed)
+        best = min(timings)
+
+        top_level = {module.split(".")[0] for _, module in imports}
+        eager_heavy = [module for module in HEAVY_MODULES if module in top_level]
+        slowest = sorted(imports, reverse=True)[:5]
+
+        print(f"{os.path.relpath(script, ROOT_DIR)}: {best:.3f}s (best of {runs})")
+        for cumulative, module in slowest:
+            print(f"\t{cumulative / 1e6:.3f}s  {module}")
+
+        if best > budget:
+            print(f"\tFAILED: startup exceeded the {budget:.3f}s budget")
+            failed = True
+        if eager_heavy:
+            print(f"\tFAILED: heavy modules imported at module level: {eager_heavy}")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS)
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+    sys.exit(main(args.budget, args.runs))
@@ -0,0 +1,179 @@
+"""Per-run metrics for the ETL scripts, written as a Prometheus textfile or as JSON lines.
+
+Metrics are opt-in: nothing is written unless METRICS_FILE is set in the .env file. A path
+ending in `.prom` is written in the Prometheus textfile format (for node_exporter's textfile
+collector), one file per script/table next to it. Anything else gets one JSON object appended
+per run.
+"""
+import json
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRIC_PREFIX = "etl_"
+# Upper bounds (seconds) of the histogram buckets
+HISTOGRAM_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, float("inf"))
+
+
+class RunMetrics:
+    """Counters, histograms and stage durations for a single run of a script against a table"""
+
+    def __init__(self, script: str, metrics_file: str = None):
+        self.script = script
+        self.table = None
+        self.metrics_file = metrics_file
+        self.started_at = time.time()
+        self.exit_code = None
+        self.counters = {}
+        self.stage_seconds = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1):
+        """Adds `value` to the counter `name`"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        """Records one observation in the histogram `name`"""
+        histogram = self.histograms.setdefault(
+            name, {"count": 0, "sum": 0, "buckets": [0] * len(HISTOGRAM_BUCKETS)}
+        )
+        histogram["count"] += 1
+        histogram["sum"] += value
+        for i, upper_bound in enumerate(HISTOGRAM_BUCKETS):
+            if value <= upper_bound:
+                histogram["buckets"][i] += 1
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        """Times the block as `stage`. Stages that run more than once are summed."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0) + seconds
+
+    @contextmanager
+    def record_run(self):
+        """Wraps the whole run, writing the metrics with its exit code however the run ends"""
+        self.exit_code = 1
+        try:
+            yield
+            self.exit_code = 0
+        except SystemExit as e:
+            # sys.exit() with a message exits with 1
+            if e.code is None:
+                self.exit_code = 0
+            elif isinstance(e.code, int):
+                self.exit_code = e.code
+            raise
+        except KeyboardInterrupt:
+            self.exit_code = 130
+            raise
+        finally:
+            self.write()
+
+    def write(self):
+        """Writes the run's metrics to the metrics file, if there is one"""
+        if not self.metrics_file:
+            return
+        if self.metrics_file.endswith(".prom"):
+            write_prometheus_textfile(self, self.metrics_file)
+        else:
+            write_json_line(self, self.metrics_file)
+
+
+def write_json_line(metrics: RunMetrics, filepath: str):
+    """Appends the run as one JSON object"""
+    record = {
+        "timestamp": datetime.fromtimestamp(metrics.started_at).isoformat(
+            timespec="seconds"
+        ),
+        "script": metrics.script,
+        "table": metrics.table,
+        "run_seconds": time.time() - metrics.started_at,
+        "exit_code": metrics.exit_code,
+        "counters": metrics.counters,
+        "stage_seconds": metrics.stage_seconds,
+        "histograms": {
+            name: {
+                "count": histogram["count"],
+                "sum": histogram["sum"],
+                "buckets": dict(
+                    zip([str(b) for b in HISTOGRAM_BUCKETS], histogram["buckets"])
+                ),
+            }
+            for name, histogram in metrics.histograms.items()
+        },
+    }
+    with open(filepath, "a") as outfile:
+        outfile.write(json.dumps(record) + "\n")
+
+
+def _labels(**labels) -> str:
+    """Formats labels as {key="value",...}, escaping the values"""
+    label_pairs = []
+    for key, value in labels.items():
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        label_pairs.append(f'{key}="{value}"')
+
+    return "{" + ",".join(label_pairs) + "}"
+
+
+def prometheus_textfile_path(metrics: RunMetrics, filepath: str) -> str:
+    """The textfile for this script/table: `filepath` with them appended, e.g. etl_load_to_db_schema.table.prom"""
+    name = "_".join(part for part in (metrics.script, metrics.table) if part)
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+    return f"{filepath[: -len('.prom')]}_{name}.prom"
+
+
+def write_prometheus_textfile(metrics: RunMetrics, filepath: str):
+    """Writes this run's samples to the script/table's own textfile (see prometheus_textfile_path)
+
+    Each script/table pair has its own file, holding its most recent run, so runs against
+    different tables never write the same file. The file is written to a unique temp file and
+    then replaced atomically, so the collector never reads a half-written file, and concurrent
+    runs against the same table can't clobber each other's temp file.
+    """
+    run_labels = {"script": metrics.script, "table": metrics.table or ""}
+    lines = []
+
+    def add(name: str, metric_type: str, value: float, family: str = None, **labels):
+        # Histogram series (_bucket/_sum/_count) share their family's TYPE line
+        type_line = f"# TYPE {family or name} {metric_type}"
+        if type_line not in lines:
+            lines.append(type_line)
+        lines.append(f"{name}{_labels(**run_labels, **labels)} {value}")
+
+    add(METRIC_PREFIX + "last_run_timestamp_seconds", "gauge", metrics.started_at)
+    add(METRIC_PREFIX + "run_seconds", "gauge", time.time() - metrics.started_at)
+    if metrics.exit_code is not None:
+        add(METRIC_PREFIX + "exit_code", "gauge", metrics.exit_code)
+    for name, value in metrics.counters.items():
+        add(METRIC_PREFIX + name, "gauge", value)
+    for stage, seconds in metrics.stage_seconds.items():
+        add(METRIC_PREFIX + "stage_seconds", "gauge", seconds, stage=stage)
+    for name, histogram in metrics.histograms.items():
+        family = METRIC_PREFIX + name
+        for upper_bound, count in zip(HISTOGRAM_BUCKETS, histogram["buckets"]):
+            le = "+Inf" if upper_bound == float("inf") else str(upper_bound)
+            add(family + "_bucket", "histogram", count, family, le=le)
+        add(family + "_sum", "histogram", histogram["sum"], family)
+        add(family + "_count", "histogram", histogram["count"], family)
+
+    textfile_path = prometheus_textfile_path(metrics, filepath)
+    # The collector only reads *.prom, so it ignores the temp file
+    fd, temp_filepath = tempfile.mkstemp(
+        suffix=".tmp", dir=os.path.dirname(textfile_path) or "."
+    )
+    with os.fdopen(fd, "w") as outfile:
+        outfile.write("\n".join(lines) + "\n")
+    # mkstemp creates the file readable only by us, but the collector may run as another user
+    os.chmod(temp_filepath, 0o644)
+    os.replace(temp_filepath, textfile_path)
@@ -0,0 +1,192 @@
+"""Detects drift between two table configs and turns it into ALTER TABLE migrations.
+
+Configs are compared as dicts of {field: (datatype, accepts_nulls, part_of_primary)}, so a
+diff is a single pass over the fields rather than a dataframe merge. Datatypes are the
+config datatypes (ALLOWED_DATA_TYPES in load_to_s3/load_to_staging_s3.py).
+"""
+
+from typing import Dict, List, NamedTuple, Tuple
+
+# Config datatype -> Postgres/Redshift column type
+SQL_TYPE_MAP = {
+    "boolean": "BOOLEAN",
+    "date": "DATE",
+    "datetime": "TIMESTAMP",
+    "float": "DOUBLE PRECISION",
+    "int": "BIGINT",
+    "varchar": "VARCHAR",
+}
+# information_schema.columns.data_type -> config datatype
+DB_TYPE_MAP = {
+    "bigint": "int",
+    "boolean": "boolean",
+    "character varying": "varchar",
+    "date": "date",
+    "double precision": "float",
+    "integer": "int",
+    "numeric": "float",
+    "real": "float",
+    "smallint": "int",
+    "text": "varchar",
+    "timestamp with time zone": "datetime",
+    "timestamp without time zone": "datetime",
+}
+# numpy dtype.kind -> config datatype (anything else is a varchar)
+PANDAS_KIND_MAP = {
+    "b": "boolean",
+    "f": "float",
+    "i": "int",
+    "u": "int",
+    "M": "datetime",
+}
+
+
+class ConfigDiff(NamedTuple):
+    """Everything that changed between an old and a new table config"""
+
+    added: Dict[str, str]  # field -> datatype
+    dropped: List[str]
+    type_changed: Dict[str, Tuple[str, str]]  # field -> (old datatype, new datatype)
+    nullability_changed: Dict[str, bool]  # field -> accepts nulls in the new config
+    old_primary: List[str]
+    new_primary: List[str]
+
+    @property
+    def primary_changed(self) -> bool:
+        # Key order follows the config's field order, which doesn't change the key
+        return set(self.old_primary) != set(self.new_primary)
+
+    def is_empty(self) -> bool:
+        return not (
+            self.added
+            or self.dropped
+            or self.type_changed
+            or self.nullability_changed
+            or self.primary_changed
+        )
+
+
+def config_df_to_fields(config_df) -> Dict[str, Tuple[str, bool, bool]]:
+    """Turns a formatted config DF (see format_config_df) into {field: (datatype, accepts_nulls, part_of_primary)}"""
+    return {
+        field: (str(datatype).lower(), bool(accepts_nulls), bool(part_of_primary))
+        for field, datatype, accepts_nulls, part_of_primary in zip(
+            config_df.index,
+            config_df["datatype"],
+            config_df["accepts_nulls"],
+            config_df["part_of_primary"],
+        )
+    }
+
+
+def df_to_fields(data_df) -> Dict[str, Tuple[str, bool, bool]]:
+    """Infers fields from a data DF's dtypes, as pd.to_sql would create them (nullable, no primary key)"""
+    return {
+        field: (PANDAS_KIND_MAP.get(dtype.kind, "varchar"), True, False)
+        for field, dtype in data_df.dtypes.items()
+    }
+
+
+def db_columns_to_fields(columns: List[Tuple]) -> Dict[str, Tuple[str, bool, bool]]:
+    """Turns (column_name, data_type, is_nullable) rows from information_schema.columns into fields"""
+    return {
+        column_name: (
+            DB_TYPE_MAP.get(data_type, "varchar"),
+            is_nullable == "YES",
+            False,
+        )
+        for column_name, data_type, is_nullable in columns
+    }
+
+
+def diff_configs(
+    old_fields: Dict[str, Tuple[str, bool, bool]],
+    new_fields: Dict[str, Tuple[str, bool, bool]],
+) -> ConfigDiff:
+    """Diffs two sets of fields in a single pass over each"""
+    added = {}
+    type_changed = {}
+    nullability_changed = {}
+    for field, (datatype, accepts_nulls, _) in new_fields.items():
+        if field not in old_fields:
+            added[field] = datatype
+            continue
+        old_datatype, old_accepts_nulls, _ = old_fields[field]
+        if old_datatype != datatype:
+            type_changed[field] = (old_datatype, datatype)
+        if old_accepts_nulls != accepts_nulls:
+            nullability_changed[field] = accepts_nulls
+
+    dropped = [field for field in old_fields if field not in new_fields]
+    old_primary = [field for field, (_, _, primary) in old_fields.items() if primary]
+    new_primary = [field for field, (_, _, primary) in new_fields.items() if primary]
+
+    return ConfigDiff(
+        added, dropped, type_changed, nullability_changed, old_primary, new_primary
+    )
+
+
+def quote_identifier(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def generate_alter_statements(
+    config_diff: ConfigDiff, table: str, schema: str = None
+) -> List[str]:
+    """Generates the minimal ALTER TABLE statements to take a table from the old config to the new one
+
+    Added columns are created nullable, since existing rows have no value for them. The
+    primary key is dropped and re-added by its Postgres default name (<table>_pkey).
+    """
+    if schema:
+        qualified_table = f"{quote_identifier(schema)}.{quote_identifier(table)}"
+    else:
+        qualified_table = quote_identifier(table)
+    alter = f"ALTER TABLE {qualified_table}"
+
+    statements = []
+    if config_diff.primary_changed and config_diff.old_primary:
+        statements.append(
+            f"{alter} DROP CONSTRAINT {quote_identifier(table + '_pkey')};"
+        )
+    for field in config_diff.dropped:
+        statements.append(f"{alter} DROP COLUMN {quote_identifier(field)};")
+    for field, datatype in config_diff.added.items():
+        statements.append(
+            f"{alter} ADD COLUMN {quote_identifier(field)} {SQL_TYPE_MAP[datatype]};"
+        )
+    for field, (_, datatype) in config_diff.type_changed.items():
+        sql_type = SQL_TYPE_MAP[datatype]
+        statements.append(
+            f"{alter} ALTER COLUMN {quote_identifier(field)} TYPE {sql_type} "
+            f"USING {quote_identifier(field)}::{sql_type};"
+        )
+    for field, accepts_nulls in config_diff.nullability_changed.items():
+        action = "DROP NOT NULL" if accepts_nulls else "SET NOT NULL"
+        statements.append(f"{alter} ALTER COLUMN {quote_identifier(field)} {action};")
+    if config_diff.primary_changed and config_diff.new_primary:
+        primary_fields = ", ".join(quote_identifier(f) for f in config_diff.new_primary)
+        statements.append(f"{alter} ADD PRIMARY KEY ({primary_fields});")
+
+    return statements
+
+
+def describe_diff(config_diff: ConfigDiff) -> str:
+    """Human-readable summary of a diff, for logging"""
+    lines = []
+    if config_diff.added:
+        lines.append(f"Added fields: {list(config_diff.added)}")
+    if config_diff.dropped:
+        lines.append(f"Dropped fields: {config_diff.dropped}")
+    for field, (old_datatype, datatype) in config_diff.type_changed.items():
+        lines.append(f"'{field}' changed type: {old_datatype} -> {datatype}")
+    for field, accepts_nulls in config_diff.nullability_changed.items():
+        lines.append(
+            f"'{field}' {'now accepts' if accepts_nulls else 'no longer accepts'} nulls"
+        )
+    if config_diff.primary_changed:
+        lines.append(
+            f"Primary key changed: {config_diff.old_primary} -> {config_diff.new_primary}"
+        )
+
+    return "\n".join(lines) if lines else "No changes"
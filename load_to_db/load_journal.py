@@ -0,0 +1,183 @@
+"""Local SQLite journal of chunked loads.
+
+Every committed chunk is recorded with its row offset, so a load that dies partway through
+can be resumed from the last committed chunk instead of starting over. The journal also
+keeps an audit trail of what was loaded where, and how fast.
+"""
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+# Bytes hashed from each end of the file when fingerprinting it
+FINGERPRINT_SAMPLE_BYTES = 1024 * 1024
+
+
+def open_load_journal(journal_path: str) -> sqlite3.Connection:
+    """Opens (creating if needed) the journal database"""
+    journal = sqlite3.connect(journal_path)
+    journal.row_factory = sqlite3.Row
+    journal.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS loads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fingerprint TEXT NOT NULL,
+            filepath TEXT NOT NULL,
+            target TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            table_rows_before INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chunks (
+            load_id INTEGER NOT NULL REFERENCES loads (id),
+            chunk_index INTEGER NOT NULL,
+            row_offset INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            seconds REAL NOT NULL,
+            committed_at TEXT NOT NULL,
+            PRIMARY KEY (load_id, chunk_index)
+        );
+        CREATE INDEX IF NOT EXISTS loads_fingerprint_target
+            ON loads (fingerprint, target, status);
+        """
+    )
+    # Journals created before table_rows_before was recorded
+    load_columns = [row["name"] for row in journal.execute("PRAGMA table_info(loads)")]
+    if "table_rows_before" not in load_columns:
+        with journal:
+            journal.execute(
+                "ALTER TABLE loads ADD COLUMN table_rows_before INTEGER NOT NULL DEFAULT 0"
+            )
+    return journal
+
+
+def fingerprint_file(filepath: str) -> str:
+    """Identifies a file by its size plus a hash of its first and last MB, without reading all of it"""
+    size = os.path.getsize(filepath)
+    sha = hashlib.sha1(str(size).encode())
+    with open(filepath, "rb") as infile:
+        sha.update(infile.read(FINGERPRINT_SAMPLE_BYTES))
+        if size > FINGERPRINT_SAMPLE_BYTES:
+            infile.seek(max(size - FINGERPRINT_SAMPLE_BYTES, FINGERPRINT_SAMPLE_BYTES))
+            sha.update(infile.read())
+
+    return f"{size}-{sha.hexdigest()}"
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def find_unfinished_load(
+    journal: sqlite3.Connection, fingerprint: str, target: str
+) -> sqlite3.Row:
+    """Returns the most recent in-progress load of this file to this target (or None), with rows committed"""
+    return journal.execute(
+        """
+        SELECT loads.*, COALESCE(SUM(chunks.row_count), 0) AS rows_committed
+        FROM loads LEFT JOIN chunks ON chunks.load_id = loads.id
+        WHERE loads.fingerprint = ? AND loads.target = ? AND loads.status = 'in_progress'
+        GROUP BY loads.id
+        ORDER BY loads.id DESC
+        LIMIT 1
+        """,
+        (fingerprint, target),
+    ).fetchone()
+
+
+def rows_loaded_into_table(
+    unfinished: sqlite3.Row, table_row_count: int, file_row_count: int
+) -> int:
+    """How many rows of an unfinished load (see find_unfinished_load) actually made it into the table
+
+    A chunk is committed to the table before it's recorded in the journal, so a crash in
+    between leaves the table exactly one chunk ahead of the journal. The table's row count is
+    the source of truth. Returns None if it can't be reconciled with the journal (for example,
+    other rows were written to the table since), since resuming would then duplicate rows.
+    """
+    rows_in_table = table_row_count - unfinished["table_rows_before"]
+    rows_committed = unfinished["rows_committed"]
+    if rows_in_table == rows_committed:
+        return rows_committed
+    # The next chunk (the final one may be shorter) made it in, but not into the journal
+    next_chunk_rows = min(unfinished["chunk_size"], file_row_count - rows_committed)
+    if next_chunk_rows > 0 and rows_in_table - rows_committed == next_chunk_rows:
+        return rows_in_table
+
+    return None
+
+
+def start_load(
+    journal: sqlite3.Connection,
+    fingerprint: str,
+    filepath: str,
+    target: str,
+    mode: str,
+    chunk_size: int,
+    table_rows_before: int = 0,
+) -> int:
+    """Records the start of a new load, and the rows already in the target table, and returns its id"""
+    with journal:
+        cursor = journal.execute(
+            """
+            INSERT INTO loads (fingerprint, filepath, target, mode, chunk_size, table_rows_before, status, started_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, 'in_progress', ?, ?)
+            """,
+            (
+                fingerprint,
+                filepath,
+                target,
+                mode,
+                chunk_size,
+                table_rows_before,
+                _now(),
+                _now(),
+            ),
+        )
+    return cursor.lastrowid
+
+
+def record_chunk(
+    journal: sqlite3.Connection,
+    load_id: int,
+    row_offset: int,
+    row_count: int,
+    seconds: float,
+):
+    """Records a chunk that has been committed to the database"""
+    with journal:
+        journal.execute(
+            """
+            INSERT INTO chunks (load_id, chunk_index, row_offset, row_count, seconds, committed_at)
+            SELECT ?, COUNT(*), ?, ?, ?, ? FROM chunks WHERE load_id = ?
+            """,
+            (load_id, row_offset, row_count, seconds, _now(), load_id),
+        )
+        journal.execute(
+            "UPDATE loads SET updated_at = ? WHERE id = ?", (_now(), load_id)
+        )
+
+
+def finish_load(journal: sqlite3.Connection, load_id: int, status: str = "complete"):
+    """Marks a load as 'complete' (or 'abandoned') so it won't be offered for resuming"""
+    with journal:
+        journal.execute(
+            "UPDATE loads SET status = ?, updated_at = ? WHERE id = ?",
+            (status, _now(), load_id),
+        )
+
+
+def summarize_load(journal: sqlite3.Connection, load_id: int) -> sqlite3.Row:
+    """Returns the chunks, rows and seconds spent inserting for a load"""
+    return journal.execute(
+        """
+        SELECT COUNT(*) AS chunk_count,
+               COALESCE(SUM(row_count), 0) AS row_count,
+               COALESCE(SUM(seconds), 0) AS seconds
+        FROM chunks WHERE load_id = ?
+        """,
+        (load_id,),
+    ).fetchone()
@@ -1,10 +1,24 @@
+import argparse
 import os
 import sys
-import git
+import time
+
+
+def find_repo_root(path: str = ".") -> str:
+    """Walks up from `path` until it finds the directory holding `.git` (no GitPython needed)"""
+    current = os.path.abspath(path)
+    while not os.path.exists(os.path.join(current, ".git")):
+        parent = os.path.dirname(current)
+        if parent == current:
+            raise FileNotFoundError(
+                f"'{os.path.abspath(path)}' is not inside a git repository"
+            )
+        current = parent
+    return current
+
 
 # Adding the repository root to the sys.path.
-repo = git.Repo(".", search_parent_directories=True)
-ROOT_DIR = repo.working_tree_dir
+ROOT_DIR = find_repo_root(".")
 sys.path.append(ROOT_DIR)
 
 from library.user_input_utils import (
@@ -14,20 +28,28 @@ from library.user_input_utils import (
     ensure_lastpass_entry_exists,
     ensure_schema_exists,
 )
-from library.database_utils import (
-    check_if_table_exists,
-    connect_to_db_with_psycopg2,
-    connect_to_db_with_sqlalchemy,
-    get_table_row_count,
-    insert_df_to_db,
+from load_journal import (
+    find_unfinished_load,
+    fingerprint_file,
+    finish_load,
+    open_load_journal,
+    record_chunk,
+    rows_loaded_into_table,
+    start_load,
+    summarize_load,
+)
+from library.schema_drift import (
+    db_columns_to_fields,
+    describe_diff,
+    df_to_fields,
+    diff_configs,
+    generate_alter_statements,
 )
 from dotenv import load_dotenv
 
-from sqlalchemy.exc import ProgrammingError
-import pandas as pd
-
 # Load environmental file
 from library.log_config import get_logger
+from library.metrics_utils import RunMetrics
 
 load_dotenv()
 
@@ -35,119 +57,529 @@ LASTPASS_USERNAME = os.environ.get("LASTPASS_USERNAME")
 MSP_STAGING = os.environ.get("MSP_STAGING_LASTPASS_ENTRY")
 DEFAULT_CSV_LOCATION = os.environ.get("DEFAULT_CSV_LOCATION")
 DEFAULT_SCHEMA = os.environ.get("DEFAULT_SCHEMA")
+LOAD_JOURNAL_PATH = os.environ.get(
+    "LOAD_JOURNAL_PATH", ROOT_DIR + "/load_journal.sqlite"
+)
+LOAD_CHUNK_SIZE = int(os.environ.get("LOAD_CHUNK_SIZE", 100000))
+METRICS_FILE = os.environ.get("METRICS_FILE")
+# With --optimize-memory, text columns with fewer distinct values than this share of rows become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def insert_df_to_db_in_chunks(
+    file_as_df,
+    conn_sa,
+    table: str,
+    if_exists: str,
+    journal,
+    load_id: int,
+    start_row: int = 0,
+    chunk_size: int = LOAD_CHUNK_SIZE,
+):
+    """Inserts the dataframe a chunk at a time, journaling each chunk once it's committed"""
+    result = None
+    # Always go through the loop once, so an empty file still creates the table
+    end_row = max(len(file_as_df.index), start_row + 1)
+    for row_offset in range(start_row, end_row, chunk_size):
+        chunk = file_as_df.iloc[row_offset : row_offset + chunk_size]
+        # Only the first chunk may create/replace the table. Everything after it is appended.
+        chunk_mode = if_exists if row_offset == start_row else "append"
+        if chunk_mode != "append" and "original_dtypes" in file_as_df.attrs:
+            # The chunk that creates the table decides its column types, so it gets the dtypes
+            # from before optimize_df_memory. Appended values are the same either way.
+            chunk = chunk.astype(file_as_df.attrs["original_dtypes"])
+
+        chunk_start = time.perf_counter()
+        with metrics.time_stage("insert"):
+            result = insert_df_to_db(chunk, conn_sa, table, chunk_mode)
+        if result is None:
+            # Leave the load 'in_progress' so it can be resumed from this chunk
+            return None
+        chunk_seconds = time.perf_counter() - chunk_start
+        record_chunk(journal, load_id, row_offset, len(chunk.index), chunk_seconds)
+        metrics.inc("rows_written", len(chunk.index))
+        metrics.observe("chunk_insert_seconds", chunk_seconds)
+
+    finish_load(journal, load_id)
+    summary = summarize_load(journal, load_id)
+    if summary["seconds"] > 0:
+        log.info(
+            f"{summary['row_count']} rows inserted in {summary['chunk_count']} chunk(s) "
+            f"({summary['row_count'] / summary['seconds']:.0f} rows/second)"
+        )
+
+    return result
+
+
+def load_df_with_journal(
+    file_as_df,
+    conn_sa,
+    conn_psy2,
+    schema: str,
+    table: str,
+    if_exists: str,
+    journal,
+    fingerprint: str,
+    filepath: str,
+):
+    """Loads the dataframe through the journal, offering to resume an interrupted load when appending"""
+    target = f"{schema}.{table}"
+    unfinished = find_unfinished_load(journal, fingerprint, target)
+
+    if unfinished is not None:
+        rows_loaded = None
+        if if_exists == "append" and unfinished["rows_committed"] > 0:
+            rows_loaded = rows_loaded_into_table(
+                unfinished,
+                get_table_row_count(schema, table, conn_psy2),
+                len(file_as_df.index),
+            )
+            if rows_loaded is None:
+                log.warning(
+                    f"'{schema}'.'{table}' no longer matches the interrupted load of this file, so it can't be resumed"
+                )
+        resume = rows_loaded is not None and yes_true_else_false(
+            f"A previous load of this file to '{schema}'.'{table}' stopped after "
+            f"{rows_loaded} rows. Do you want to resume from there?"
+        )
+        if resume:
+            if rows_loaded > unfinished["rows_committed"]:
+                # Journal the chunk that was committed to the table before the crash
+                record_chunk(
+                    journal,
+                    unfinished["id"],
+                    unfinished["rows_committed"],
+                    rows_loaded - unfinished["rows_committed"],
+                    0,
+                )
+            log.info(f"Resuming load from row {rows_loaded}")
+            return insert_df_to_db_in_chunks(
+                file_as_df,
+                conn_sa,
+                table,
+                "append",
+                journal,
+                unfinished["id"],
+                rows_loaded,
+                unfinished["chunk_size"],
+            )
+        finish_load(journal, unfinished["id"], "abandoned")
+
+    # Rows already in the table, so a resumed load can tell which of its rows were committed
+    table_rows_before = (
+        get_table_row_count(schema, table, conn_psy2) if if_exists == "append" else 0
+    )
+    load_id = start_load(
+        journal,
+        fingerprint,
+        filepath,
+        target,
+        if_exists,
+        LOAD_CHUNK_SIZE,
+        table_rows_before,
+    )
+    result = insert_df_to_db_in_chunks(
+        file_as_df, conn_sa, table, if_exists, journal, load_id
+    )
+
+    return result
+
+
+def append_df_to_table(
+    file_as_df,
+    conn_sa,
+    conn_psy2,
+    schema: str,
+    table: str,
+    journal,
+    fingerprint: str,
+    filepath: str,
+):
+    """Appends the dataframe to an existing table and logs how many rows it gained"""
+    table_rows_pre = get_table_row_count(schema, table, conn_psy2)
+    result = load_df_with_journal(
+        file_as_df,
+        conn_sa,
+        conn_psy2,
+        schema,
+        table,
+        "append",
+        journal,
+        fingerprint,
+        filepath,
+    )
+    if result is not None:
+        table_rows = get_table_row_count(schema, table, conn_psy2)
+        log.info(
+            f"{table_rows - table_rows_pre} rows appended and {table_rows} now exist in '{schema}'.'{table}',"
+        )
+
+    return result
+
+
+def get_table_fields(schema: str, table: str, conn_psy2) -> dict:
+    """Reads the table's columns from information_schema as schema_drift fields"""
+    with conn_psy2.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT column_name, data_type, is_nullable
+            FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s
+            ORDER BY ordinal_position
+            """,
+            (schema, table),
+        )
+        return db_columns_to_fields(cursor.fetchall())
+
+
+def add_new_columns_to_table(file_as_df, schema: str, table: str, conn_psy2) -> bool:
+    """Diffs the table against the csv, and offers to ADD COLUMN any csv columns the table is missing
+
+    Only added columns are migrated. Dropping or retyping existing columns could lose data, so
+    those differences are only logged. Returns True if the table was altered.
+    """
+    config_diff = diff_configs(
+        get_table_fields(schema, table, conn_psy2), df_to_fields(file_as_df)
+    )
+    if not config_diff.added:
+        return False
+    log.info(
+        f"Differences between '{schema}'.'{table}' and the csv:\n{describe_diff(config_diff)}"
+    )
+
+    # Table columns missing from the csv are simply left null by the append
+    added_only = config_diff._replace(
+        dropped=[],
+        type_changed={},
+        nullability_changed={},
+        new_primary=config_diff.old_primary,
+    )
+    statements = generate_alter_statements(added_only, table, schema)
+    statements_text = "\n".join(statements)
+    if not yes_true_else_false(
+        f"Do you want to add the new column(s) to '{schema}'.'{table}' with:\n{statements_text}\n"
+    ):
+        return False
+
+    with conn_psy2.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    conn_psy2.commit()
+    log.info(f"Added {list(config_diff.added)} to '{schema}'.'{table}'")
+
+    return True
+
+
+def read_csv_columns(
+    filepath: str, columns: list = None, optimize_memory: bool = False
+):
+    """Reads the csv into a DF, only parsing `columns` (or every column if None)
+
+    With `optimize_memory`, the csv is read a chunk at a time and each chunk is shrunk
+    (optimize_df_memory) before the next is read, so the full-size DF is never in memory.
+    Columns pandas reads as different types in different chunks are read whole instead, so
+    the values are the same as a plain read's.
+    """
+    import pandas as pd
+
+    if columns:
+        header = pd.read_csv(filepath, nrows=0).columns
+        missing_columns = [column for column in columns if column not in header]
+        if missing_columns:
+            raise ValueError(
+                f"Columns {missing_columns} are not in '{filepath}'. Columns in the file: {list(header)}"
+            )
+
+    if not optimize_memory:
+        return pd.read_csv(filepath, usecols=columns)
+
+    from pandas.api.types import union_categoricals
+
+    chunks = []
+    # Empty copies of the chunks as read, to compare the dtypes pandas inferred for each chunk
+    empty_chunks = []
+    memory_before = 0
+    for chunk in pd.read_csv(filepath, usecols=columns, chunksize=LOAD_CHUNK_SIZE):
+        memory_before += chunk.memory_usage(deep=True).sum()
+        empty_chunks.append(chunk.iloc[:0])
+        chunks.append(optimize_df_memory(chunk))
+    original_dtypes = pd.concat(empty_chunks).dtypes.to_dict()
+
+    # pandas infers each chunk's dtypes on its own. A column of zip codes can be all digits in one
+    # chunk (read as ints, losing leading zeros) and have letters in another (read as text), so
+    # columns whose chunks disagree are re-read whole. Mixing ints and floats is safe.
+    mixed_columns = [
+        column
+        for column in empty_chunks[0].columns
+        if len({str(empty_chunk[column].dtype) for empty_chunk in empty_chunks}) > 1
+        and not all(
+            empty_chunk[column].dtype.kind in ("i", "u", "f")
+            for empty_chunk in empty_chunks
+        )
+    ]
+    if mixed_columns:
+        chunks = [chunk.drop(columns=mixed_columns) for chunk in chunks]
+
+    # Each chunk's categoricals have their own categories, which concat would turn back into text
+    for column in chunks[0].columns:
+        if all(
+            isinstance(chunk[column].dtype, pd.CategoricalDtype) for chunk in chunks
+        ):
+            categories = union_categoricals(
+                [chunk[column] for chunk in chunks]
+            ).categories
+            for chunk in chunks:
+                chunk[column] = chunk[column].cat.set_categories(categories)
+
+    file_as_df = pd.concat(chunks, ignore_index=True)
+    del chunks
+
+    if mixed_columns:
+        log.info(
+            f"Columns {mixed_columns} were read as different types in different chunks, "
+            f"so they're read without chunking"
+        )
+        mixed_df = pd.read_csv(filepath, usecols=mixed_columns)
+        original_dtypes.update(mixed_df.dtypes.to_dict())
+        mixed_df = optimize_df_memory(mixed_df)
+        # Back in their places, in file order
+        column_order = list(empty_chunks[0].columns)
+        for column in sorted(mixed_columns, key=column_order.index):
+            file_as_df.insert(column_order.index(column), column, mixed_df[column])
+
+    file_as_df.attrs["original_dtypes"] = original_dtypes
+    memory_after = file_as_df.memory_usage(deep=True).sum()
+    log.info(
+        f"Optimized memory from {memory_before / 1024 ** 2:.1f} MB to "
+        f"{memory_after / 1024 ** 2:.1f} MB ({memory_before / max(memory_after, 1):.1f}x smaller)"
+    )
+
+    return file_as_df
+
+
+def optimize_df_memory(file_as_df):
+    """Shrinks a DF (or a chunk of one) in memory
+
+    Integers are downcast to the smallest type that fits, floats to float32 only when no value
+    changes, and repetitive text becomes categoricals (other text becomes Arrow strings, if
+    pyarrow is installed). Values are unchanged, only their dtypes.
+    """
+    import pandas as pd
+
+    try:
+        import pyarrow  # noqa: F401
+
+        arrow_strings = True
+    except ImportError:
+        arrow_strings = False
+
+    for column, dtype in file_as_df.dtypes.items():
+        series = file_as_df[column]
+        if dtype.kind in ("i", "u"):
+            file_as_df[column] = pd.to_numeric(
+                series, downcast="integer" if dtype.kind == "i" else "unsigned"
+            )
+        elif dtype.kind == "f":
+            downcast = pd.to_numeric(series, downcast="float")
+            # Only keep the smaller float if every value survives the round trip
+            if downcast.dtype != dtype and downcast.astype(dtype).equals(series):
+                file_as_df[column] = downcast
+        elif dtype == object or isinstance(dtype, pd.StringDtype):
+            if series.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(series.index):
+                file_as_df[column] = series.astype("category")
+            elif arrow_strings and dtype == object:
+                file_as_df[column] = series.astype("string[pyarrow]")
+
+    return file_as_df
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load a local csv into a table in the MSP Staging database"
+    )
+    parser.add_argument(
+        "--columns",
+        help="Comma-separated csv columns to load. Other columns are never read. (Default: all)",
+    )
+    parser.add_argument(
+        "--optimize-memory",
+        action="store_true",
+        help="Downcast numbers and encode repetitive text as categoricals to load larger files",
+    )
+    args = parser.parse_args()
+    load_columns = args.columns.split(",") if args.columns else None
+
     # Initiate logging
     log = get_logger(__name__)
+    metrics = RunMetrics("load_to_db", METRICS_FILE)
 
-    # Ensure the LastPass Entry exists
-    lpass_manager = ensure_lastpass_entry_exists(MSP_STAGING)
+    with metrics.record_run():
+        # Ensure the LastPass Entry exists
+        lpass_manager = ensure_lastpass_entry_exists(MSP_STAGING)
 
-    # Connect to Db through psycopg (allows querying)
-    conn_psy2 = connect_to_db_with_psycopg2(lpass_manager)
+        # Ensure file exists
+        filename, directory, filepath = ensure_file_exists(
+            f"What is the name of the csv you would like to load to the '{lpass_manager.database}' database? ",
+            "Where is the file located?",
+            DEFAULT_CSV_LOCATION,
+        )
 
-    # Ensure file exists
-    filename, directory, filepath = ensure_file_exists(
-        f"What is the name of the csv you would like to load to the '{lpass_manager.database}' database? ",
-        "Where is the file located?",
-        DEFAULT_CSV_LOCATION,
-    )
+        # Heavy database modules (sqlalchemy, psycopg2) are only imported once the prompts are answered
+        from library.database_utils import (
+            check_if_table_exists,
+            connect_to_db_with_sqlalchemy,
+            get_table_row_count,
+            insert_df_to_db,
+        )
+        from sqlalchemy.exc import ProgrammingError
 
-    # File to dataframe
-    file_as_df = pd.read_csv(filepath)
-    file_length = len(file_as_df.index)
-    log.info(f"{file_length} rows exist in '{filename}'")
+        # One connection to the Db: sequelalchemy (allows pd.to_sql) and the psycopg2 connection beneath it (allows querying)
+        conn_sa = connect_to_db_with_sqlalchemy(lpass_manager)
+        conn_psy2 = conn_sa.connection
 
-    # Ensure schema exists in database
-    schema, df_tables_in_schema = ensure_schema_exists(DEFAULT_SCHEMA, conn_psy2)
+        # File to dataframe, only parsing the columns being loaded
+        with metrics.time_stage("read"):
+            file_as_df = read_csv_columns(filepath, load_columns, args.optimize_memory)
+        file_length = len(file_as_df.index)
+        metrics.inc("rows_read", file_length)
+        metrics.inc("bytes_read", os.path.getsize(filepath))
+        log.info(f"{file_length} rows exist in '{filename}'")
 
-    # Connect to Db through sequelalchemy (allows pd.to_sql)
-    conn_sa = connect_to_db_with_sqlalchemy(lpass_manager)
+        # Journal of committed chunks, so an interrupted load can be resumed
+        journal = open_load_journal(LOAD_JOURNAL_PATH)
+        fingerprint = fingerprint_file(filepath)
+        if load_columns:
+            # A load of different columns from the same file isn't the same load
+            fingerprint += ":" + ",".join(load_columns)
 
-    # Loop until the user determines the desired table to import to, and the import succeeds.
+        # Ensure schema exists in database
+        schema, df_tables_in_schema = ensure_schema_exists(DEFAULT_SCHEMA, conn_psy2)
 
-    while True:
-        # Default table name = same as filename (without .csv)
-        if filename[-4:] == ".csv":
-            table_guess = filename[:-4]
-            table = enter_for_default("What is the table name?", table_guess)
-        else:
-            table = enter_for_default("What is the table name?", filename)
+        # Loop until the user determines the desired table to import to, and the import succeeds.
 
-        # Check if table exists
-        if check_if_table_exists(schema, table, df_tables_in_schema):
-            intended = yes_true_else_false(
-                f"The table `{table}` already exists. Was this expected?",
-            )
+        while True:
+            # Default table name = same as filename (without .csv)
+            if filename[-4:] == ".csv":
+                table_guess = filename[:-4]
+                table = enter_for_default("What is the table name?", table_guess)
+            else:
+                table = enter_for_default("What is the table name?", filename)
+            metrics.table = f"{schema}.{table}"
 
-            # The table exists AND they knew it existed
-            if intended:
-                # Loop until they properly indicate they want to append or overwrite the existing data
-                while True:
-                    append_replace = input(
-                        "Do you want to (O)verwrite, or (A)ppend to the existing table? "
-                    )
-                    table_exists = True
-                    # They want to drop the existing table
-                    if append_replace.lower() in ("overwrite", "o"):
-                        append_replace = "replace"
-                        break
-                    # They want to append to the existing table.
-                    elif append_replace.lower() in ("append", "a"):
-                        append_replace = "append"
-                        break
+            # Check if table exists
+            if check_if_table_exists(schema, table, df_tables_in_schema):
+                intended = yes_true_else_false(
+                    f"The table `{table}` already exists. Was this expected?",
+                )
 
-                if append_replace == "append":
-                    # Check if the table columns match the csv columns
-                    try:
-                        table_rows_pre = get_table_row_count(schema, table, conn_psy2)
-                        result = insert_df_to_db(
-                            file_as_df, conn_sa, table, append_replace
+                # The table exists AND they knew it existed
+                if intended:
+                    # Loop until they properly indicate they want to append or overwrite the existing data
+                    while True:
+                        append_replace = input(
+                            "Do you want to (O)verwrite, or (A)ppend to the existing table? "
+                        )
+                        table_exists = True
+                        # They want to drop the existing table
+                        if append_replace.lower() in ("overwrite", "o"):
+                            append_replace = "replace"
+                            break
+                        # They want to append to the existing table.
+                        elif append_replace.lower() in ("append", "a"):
+                            append_replace = "append"
+                            break
+
+                    if append_replace == "append":
+                        # Check if the table columns match the csv columns
+                        try:
+                            append_df_to_table(
+                                file_as_df,
+                                conn_sa,
+                                conn_psy2,
+                                schema,
+                                table,
+                                journal,
+                                fingerprint,
+                                filepath,
+                            )
+                            # SUCCESS! If we get here, the rows in the csv existed in the table, and new rows were appended.
+                            break
+                        except ProgrammingError as e:
+                            # At least one of the rows in the csv did not exist in the table.
+                            conn_psy2.rollback()
+                            print("\n")
+                            # Offer to ALTER the new columns into the table, rather than overwriting it
+                            if add_new_columns_to_table(
+                                file_as_df, schema, table, conn_psy2
+                            ):
+                                append_df_to_table(
+                                    file_as_df,
+                                    conn_sa,
+                                    conn_psy2,
+                                    schema,
+                                    table,
+                                    journal,
+                                    fingerprint,
+                                    filepath,
+                                )
+                                break
+                            # Go back to the start of the loop.
+                            log.error(
+                                f"Appending FAILED.\nEnsure the csv columns exist in the table.\nConsider overwriting existing table, using a new table name, or renaming the csv columns.\n"
+                            )
+                    # Replace the existing table with the new data, regardless of the columns.
+                    if append_replace == "replace":
+                        result = load_df_with_journal(
+                            file_as_df,
+                            conn_sa,
+                            conn_psy2,
+                            schema,
+                            table,
+                            append_replace,
+                            journal,
+                            fingerprint,
+                            filepath,
                         )
                         if result is not None:
                             table_rows = get_table_row_count(schema, table, conn_psy2)
                             log.info(
-                                f"{table_rows - table_rows_pre} rows appended and {table_rows} now exist in '{schema}'.'{table}',"
+                                f"'{schema}'.'{table}' was dropped, and {table_rows} rows were written in its place."
                             )
-                            # SUCCESS! If we get here, the rows in the csv existed in the table, and new rows were appended.
+                        # SUCCESS! The existing table was dropped and new data inserted.
                         break
-                    except ProgrammingError as e:
-                        # At least one of the rows in the csv did not exist in the table. Go back to the start of the loop.
-                        print("\n")
-                        log.error(
-                            f"Appending FAILED.\nEnsure the csv columns exist in the table.\nConsider overwriting existing table, using a new table name, or renaming the csv columns.\n"
-                        )
-                # Replace the existing table with the new data, regardless of the columns.
-                if append_replace == "replace":
-                    result = insert_df_to_db(file_as_df, conn_sa, table, append_replace)
+
+            # If the table name is blank, start over
+            elif table == "":
+                pass
+            # A table with that name does not yet exist
+            else:
+                # Did they intend to create a new table? If not, go back to start of loop.
+                intended = yes_true_else_false(
+                    f"A new table, '{table}' will be created. Ready to continue?"
+                )
+                table_exists = False
+
+                # They intended to create a new table, create new table.
+                if intended:
+                    result = load_df_with_journal(
+                        file_as_df,
+                        conn_sa,
+                        conn_psy2,
+                        schema,
+                        table,
+                        "fail",
+                        journal,
+                        fingerprint,
+                        filepath,
+                    )
+
                     if result is not None:
                         table_rows = get_table_row_count(schema, table, conn_psy2)
                         log.info(
-                            f"'{schema}'.'{table}' was dropped, and {table_rows} rows were written in its place."
+                            f"{table_rows} rows were written to '{schema}'.'{table}'"
                         )
-                    # SUCCESS! The existing table was dropped and new data inserted.
+                        # SUCCESS! A new table was created and rows inserted.
                     break
 
-        # If the table name is blank, start over
-        elif table == "":
-            pass
-        # A table with that name does not yet exist
-        else:
-            # Did they intend to create a new table? If not, go back to start of loop.
-            intended = yes_true_else_false(
-                f"A new table, '{table}' will be created. Ready to continue?"
-            )
-            table_exists = False
-
-            # They intended to create a new table, create new table.
-            if intended:
-                result = insert_df_to_db(file_as_df, conn_sa, table)
-
-                if result is not None:
-                    table_rows = get_table_row_count(schema, table, conn_psy2)
-                    log.info(f"{table_rows} rows were written to '{schema}'.'{table}'")
-                    # SUCCESS! A new table was created and rows inserted.
-                break
-
-    conn_sa.close()
+        conn_sa.close()
+        journal.close()
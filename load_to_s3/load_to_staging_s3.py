@@ -1,34 +1,53 @@
+from __future__ import annotations
+
+import io
 import os
 import sys
-import git
+import csv
+import random
 import shutil
 import json
-import pandas as pd
-import numpy as np
-import pandera as pa
-from pandera import Column, DataFrameSchema, Check, Index
-from pandera.errors import SchemaErrors
-from sqlalchemy import JSON
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
-from typing import Tuple
+from typing import Tuple, TYPE_CHECKING
 from dotenv import load_dotenv
-from pandas import DataFrame as DF
 from datetime import date, datetime
 
+# pandas, numpy, pandera and sqlalchemy are imported inside the functions that use them
+# so the prompts come up without paying for those imports.
+if TYPE_CHECKING:
+    import pandas as pd
+    from pandas import DataFrame as DF
+    from pandera import DataFrameSchema
+    from sqlalchemy import JSON
+
+
+def find_repo_root(path: str = ".") -> str:
+    """Walks up from `path` until it finds the directory holding `.git` (no GitPython needed)"""
+    current = os.path.abspath(path)
+    while not os.path.exists(os.path.join(current, ".git")):
+        parent = os.path.dirname(current)
+        if parent == current:
+            raise FileNotFoundError(
+                f"'{os.path.abspath(path)}' is not inside a git repository"
+            )
+        current = parent
+    return current
+
+
 # Adding the repository root to the sys.path.
-repo = git.Repo(".", search_parent_directories=True)
-ROOT_DIR = repo.working_tree_dir
+ROOT_DIR = find_repo_root(".")
 sys.path.append(ROOT_DIR)
 sys.path.append(ROOT_DIR + "/library/")
 
 
-from library.connection_utils import connect_to_aws_service
 from library.file_utils import ensure_file_slash, make_dir_if_not_exists
-from library.s3_utils import (
-    check_if_folder_exists_in_s3_bucket,
-    move_local_file_to_s3,
-    pull_file_from_s3,
-    create_directory_in_s3,
+from library.metrics_utils import RunMetrics
+from library.schema_drift import (
+    config_df_to_fields,
+    describe_diff,
+    diff_configs,
+    generate_alter_statements,
 )
 from library.user_input_utils import (
     ensure_file_exists,
@@ -44,6 +63,24 @@ AWS_ROLE_NAME = os.environ.get("AWS_ROLE_NAME")
 S3_BUCKET = os.environ.get("DEFAULT_S3_BUCKET")
 DEFAULT_CSV_LOCATION = os.environ.get("DEFAULT_CSV_LOCATION")
 DEFAULT_CSV_LOCATION = ROOT_DIR + "/" + DEFAULT_CSV_LOCATION
+# Partitioned layout: <table>/dt=YYYY-MM-DD/run=HHMMSS/part-N.csv, plus <table>/_manifest.json
+S3_PARTITIONED_LAYOUT = (
+    os.environ.get("S3_PARTITIONED_LAYOUT", "false").lower() == "true"
+)
+S3_PART_TARGET_MB = int(os.environ.get("S3_PART_TARGET_MB", 128))
+S3_UPLOAD_WORKERS = int(os.environ.get("S3_UPLOAD_WORKERS", 4))
+MANIFEST_FILENAME = "_manifest.json"
+METRICS_FILE = os.environ.get("METRICS_FILE")
+# Data validation error report: how many example failures to keep per column/check, and whether to gzip them
+VALIDATION_EXAMPLES_PER_CHECK = int(os.environ.get("VALIDATION_EXAMPLES_PER_CHECK", 20))
+VALIDATION_ERRORS_GZIP = (
+    os.environ.get("VALIDATION_ERRORS_GZIP", "true").lower() == "true"
+)
+# Pre-flight: validate a sample of the data (head, tail and random blocks) before reading all of it
+PREFLIGHT_SAMPLING = os.environ.get("PREFLIGHT_SAMPLING", "true").lower() == "true"
+PREFLIGHT_BLOCK_KB = int(os.environ.get("PREFLIGHT_BLOCK_KB", 256))
+PREFLIGHT_RANDOM_BLOCKS = int(os.environ.get("PREFLIGHT_RANDOM_BLOCKS", 8))
+PREFLIGHT_MAX_FAILURE_RATE = float(os.environ.get("PREFLIGHT_MAX_FAILURE_RATE", 0.01))
 ALLOWED_DATA_TYPES = ["boolean", "date", "datetime", "float", "int", "varchar"]
 TYPE_MAP = {
     "boolean": bool,
@@ -62,6 +99,7 @@ def create_config_json_from_df(
     out_filename: str = "config.json",
 ):
     """Creates the config.json file from a dataframe"""
+    import numpy as np
 
     try:
         # If the DF has not yet had the 'field' column set as index, set it
@@ -103,6 +141,8 @@ def create_relational_config_from_json(
     out_filename: str = "config.csv",
 ) -> DF:
     "Takes config.json as an input and creates a dataframe"
+    from pandas import DataFrame as DF
+
     # If it's a string, make it a JSON object
     if type(config_json) is str:
         config_json = json.loads(config_json)
@@ -133,19 +173,16 @@ def create_relational_config_from_json(
 
 def compare_config_to_data_cols(config_df: DF, data_as_df: DF) -> Tuple:
     """Compares the 'fields' column in config to the column headers in the data."""
-    config_cols = DF(config_df.index)
-    data_cols = DF(data_as_df.columns)
-
-    config_cols.columns = ["field"]
+    config_cols = list(config_df.index)
     log.info(f"Fields retreived from config")
-    data_cols.columns = ["field"]
+    data_cols = list(data_as_df.columns)
     log.info(f"Fields retreived from {data_filename}")
 
-    # Merge DFs so we know which side has extra columns
-    merged = config_cols.merge(data_cols, on="field", how="outer", indicator=True)
-
-    config_only_cols = merged[merged["_merge"] == "left_only"]["field"].to_list()
-    new_data_only_cols = merged[merged["_merge"] == "right_only"]["field"].to_list()
+    # Set lookups so we know which side has extra columns, keeping each side's order
+    config_col_set = set(config_cols)
+    data_col_set = set(data_cols)
+    config_only_cols = [field for field in config_cols if field not in data_col_set]
+    new_data_only_cols = [field for field in data_cols if field not in config_col_set]
 
     return config_only_cols, new_data_only_cols
 
@@ -161,6 +198,8 @@ def ensure_valid_datatype(field: str):
 
 def force_boolean_series(col: pd.Series):
     """Read in a series and change from string to boolean"""
+    import numpy as np
+
     col = col.astype(str).str.lower()
     col.replace(["true", "false", "nan"], [True, False, np.nan], inplace=True)
 
@@ -169,6 +208,8 @@ def force_boolean_series(col: pd.Series):
 
 def format_config_df(config_df: DF) -> DF:
     """Function to format the config_df regardless of where it comes from"""
+    import numpy as np
+
     try:
         # If the DF has not yet had the 'field' column set as index, set it
         config_df.columns = ["field", "datatype", "accepts_nulls", "part_of_primary"]
@@ -186,6 +227,8 @@ def format_config_df(config_df: DF) -> DF:
 
 
 def choose_config_from_local(config_csv: str = None):
+    import pandas as pd
+
     # Added to allow for faster testing
     if config_csv:
         config_filepath = DEFAULT_CSV_LOCATION + config_csv
@@ -219,6 +262,11 @@ def choose_config_csv_and_compare_to_data_cols(data_as_df: DF):
             Fields in data upload not in config: {data_only_cols}
                 """
             )
+            # Data fields the config leaves out are simply not read, validated or uploaded
+            if not config_only_cols and yes_true_else_false(
+                "Do you want to upload the data without the fields that aren't in the config?"
+            ):
+                return config_df
         else:
             log.info(f"Fields from config and {data_filename} match")
             return config_df
@@ -226,6 +274,9 @@ def choose_config_csv_and_compare_to_data_cols(data_as_df: DF):
 
 def find_invalid_config_rows(config_df: DF):
     """Validates the configuration files and returns a DF of the failures if its not valid"""
+    from pandas import DataFrame as DF
+    from pandera import Column, DataFrameSchema, Check, Index
+    from pandera.errors import SchemaErrors
 
     config_schema = DataFrameSchema(
         index=Index(str),
@@ -366,6 +417,8 @@ def find_invalid_config_rows_and_fix(
 
 def generate_pandera_schema_for_data(config_df: DF) -> DataFrameSchema:
     """Programatically generates the schema to be used by Pandera to validate the data"""
+    from pandera import Column, DataFrameSchema
+
     data_schema = DataFrameSchema(strict=True, unique_column_names=True)
 
     new_cols = {}
@@ -388,6 +441,39 @@ def generate_pandera_schema_for_data(config_df: DF) -> DataFrameSchema:
     return data_schema
 
 
+def write_validation_error_report(
+    failure_df: DF,
+    directory: str,
+    examples_per_check: int = VALIDATION_EXAMPLES_PER_CHECK,
+    compress: bool = VALIDATION_ERRORS_GZIP,
+) -> Tuple:
+    """Writes failure counts per column/check, plus the first few failures of each, rather than every failure
+
+    The report grows with the number of distinct problems, not the number of bad cells.
+    """
+    make_dir_if_not_exists(directory)
+    failure_groups = failure_df.groupby(["column", "check"], dropna=False, sort=False)
+
+    summary_df = (
+        failure_groups.size()
+        .reset_index(name="failure_count")
+        .sort_values("failure_count", ascending=False, ignore_index=True)
+    )
+    summary_filepath = directory + "data_validation_summary.csv"
+    summary_df.to_csv(summary_filepath, index=False)
+
+    examples_filepath = directory + "data_validation_errors.csv"
+    if compress:
+        examples_filepath += ".gz"
+    failure_groups.head(examples_per_check).to_csv(
+        examples_filepath,
+        index=False,
+        compression="gzip" if compress else None,
+    )
+
+    return summary_df, summary_filepath, examples_filepath
+
+
 def validate_data_dtypes(
     data_df: DF,
     data_schema: DataFrameSchema,
@@ -395,6 +481,9 @@ def validate_data_dtypes(
     data_directory=DEFAULT_CSV_LOCATION,
 ):
     """Validates the dataframe datatypes vs those defined in the config"""
+    from pandas import DataFrame as DF
+    from pandera.errors import SchemaErrors
+
     try:
         data_schema.validate(data_df, lazy=True)
         # Return empty datafreame if config is valid
@@ -402,16 +491,13 @@ def validate_data_dtypes(
         return DF()
     except SchemaErrors as e:
         failure_df = e.failure_cases
-        if len(failure_df.index) > 5:
-            log.error(f"Failures [First 5 rows]:\n{failure_df.head()}")
-        else:
-            log.error(f"Failures:\n{failure_df}")
 
-        # Save errors to a file so the user can debug
+        # Save a summary and examples of the errors so the user can debug
         directory = ensure_file_slash(data_directory) + ensure_file_slash(table)
-        make_dir_if_not_exists(directory)
-        filepath = directory + "data_validation_errors.csv"
-        failure_df.to_csv(filepath)
+        summary_df, summary_filepath, examples_filepath = write_validation_error_report(
+            failure_df, directory
+        )
+        log.error(f"Failures by column and check:\n{summary_df.head(10)}")
         log.error(
             """
 ------------------------------------------------------------------------
@@ -420,11 +506,131 @@ Please check error output for problematic columns/values.
 NOTE: Data files still uploaded as this check is not 100% accurate.
 ------------------------------------------------------------------------"""
         )
-        log.info(f"Validation errors saved to {filepath}")
+        log.info(
+            f"Validation error summary saved to {summary_filepath}, and examples saved to {examples_filepath}"
+        )
 
         return failure_df
 
 
+def read_data_sample(
+    data_filepath: str,
+    load_columns: list,
+    block_bytes: int = PREFLIGHT_BLOCK_KB * 1024,
+    random_blocks: int = PREFLIGHT_RANDOM_BLOCKS,
+) -> Tuple:
+    """Reads rows from the head, the tail and one random block per stratum in between, seeking instead of reading the whole file
+
+    Returns the sample DF and an estimate of the number of rows in the file. Raises ValueError
+    if the sample can't be split into rows (e.g. quoted values span lines).
+    """
+    import pandas as pd
+
+    file_size = os.path.getsize(data_filepath)
+    with open(data_filepath, "rb") as infile:
+        header = infile.readline()
+        body_start = infile.tell()
+        body_size = file_size - body_start
+
+        if body_size <= block_bytes * (random_blocks + 2):
+            # Small enough that the sample would be most of the file anyway
+            lines = infile.read().splitlines(keepends=True)
+        else:
+            # The middle of the file is split into equal strata, with one block at a random
+            # offset inside each, so blocks are spread across the file and never overlap
+            middle_start = body_start + block_bytes
+            stratum_bytes = (file_size - block_bytes - middle_start) // max(
+                random_blocks, 1
+            )
+            offsets = (
+                [body_start]
+                + [
+                    middle_start
+                    + stratum * stratum_bytes
+                    + random.randrange(stratum_bytes - block_bytes + 1)
+                    for stratum in range(random_blocks)
+                ]
+                + [file_size - block_bytes]
+            )
+            lines = []
+            for offset in offsets:
+                infile.seek(offset)
+                block_lines = infile.read(block_bytes).splitlines(keepends=True)
+                # Drop the partial lines at either end of the block
+                if offset != body_start:
+                    block_lines = block_lines[1:]
+                if offset + block_bytes < file_size:
+                    block_lines = block_lines[:-1]
+                lines.extend(block_lines)
+
+            # Quotes come in pairs on a line, unless a quoted field runs onto the next line. Then
+            # a block may start inside a field, and its lines aren't whole rows.
+            if any(line.count(b'"') % 2 for line in [header] + lines):
+                raise ValueError(
+                    "the csv has quoted values that span lines, so it can't be sampled by line"
+                )
+
+    sample_bytes = sum(len(line) for line in lines)
+    sample_df = pd.read_csv(io.BytesIO(header + b"".join(lines)), usecols=load_columns)
+    if sample_bytes:
+        estimated_rows = round(body_size * len(sample_df.index) / sample_bytes)
+    else:
+        estimated_rows = 0
+
+    return sample_df, estimated_rows
+
+
+def preflight_check_data(data_filepath: str, load_columns: list, config_df: DF) -> bool:
+    """Validates a sample of the data against the config before committing to a full read and upload
+
+    Returns True if the full run should go ahead.
+    """
+    from pandera.errors import SchemaErrors
+
+    try:
+        sample_df, estimated_rows = read_data_sample(data_filepath, load_columns)
+    except ValueError as e:
+        # Includes pandas' ParserError. The full validation still runs.
+        log.warning(f"Pre-flight: couldn't sample the data ({e}), skipping")
+        return True
+    sample_rows = len(sample_df.index)
+    if not sample_rows:
+        log.info("Pre-flight: the data has no rows to sample, skipping")
+        return True
+    data_schema = generate_pandera_schema_for_data(config_df)
+
+    try:
+        data_schema.validate(sample_df, lazy=True)
+        log.info(
+            f"Pre-flight: {sample_rows} sampled rows (of ~{estimated_rows}) align with config"
+        )
+        return True
+    except SchemaErrors as e:
+        failure_df = e.failure_cases
+
+    failing_rows = failure_df["index"].dropna().nunique()
+    failure_rate = failing_rows / sample_rows
+    log.warning(
+        f"Pre-flight: {failing_rows} of {sample_rows} sampled rows failed validation. "
+        f"About {failure_rate:.1%} of the ~{estimated_rows} rows in the file may not align with the config."
+    )
+    # Failures without a row (e.g. a missing column) affect the whole file
+    schema_failures = failure_df[failure_df["index"].isna()]
+    if not schema_failures.empty:
+        log.warning(
+            f"Pre-flight schema failures:\n{schema_failures[['column', 'check', 'failure_case']]}"
+        )
+    elif failure_rate <= PREFLIGHT_MAX_FAILURE_RATE:
+        return True
+
+    log.warning(
+        f"Sample failures by column and check:\n{failure_df.groupby(['column', 'check'], dropna=False).size()}"
+    )
+    return yes_true_else_false(
+        "Do you want to continue with the full validation and upload?"
+    )
+
+
 def create_data_schema_and_validate_data_dtypes(
     data_df: DF, config_df: DF, table, data_directory
 ) -> DF:
@@ -435,289 +641,627 @@ def create_data_schema_and_validate_data_dtypes(
     return failure_df
 
 
+def create_migration_from_config_drift(
+    old_config_df: DF,
+    new_config_df: DF,
+    table: str,
+    directory: str,
+    out_filename: str = "migration.sql",
+):
+    """Diffs the old and new configs and writes the ALTER TABLE statements between them to a file
+
+    Returns the file name, or None if the configs don't differ.
+    """
+    config_diff = diff_configs(
+        config_df_to_fields(old_config_df), config_df_to_fields(new_config_df)
+    )
+    if config_diff.is_empty():
+        log.info("Config matches the existing config.json, no migration needed")
+        return None
+
+    log.info(f"Config drift for '{table}':\n{describe_diff(config_diff)}")
+    statements = generate_alter_statements(config_diff, table)
+
+    make_dir_if_not_exists(directory)
+    filepath = ensure_file_slash(directory) + out_filename
+    with open(filepath, "w") as outfile:
+        outfile.write("\n".join(statements) + "\n")
+    log.info(f"Created '{out_filename}' with {len(statements)} ALTER statement(s)")
+
+    return out_filename
+
+
+def read_data_header(data_filepath: str) -> DF:
+    """Reads only the header row of the data, as an empty DF, so the config can be compared to it"""
+    import pandas as pd
+
+    return pd.read_csv(data_filepath, nrows=0)
+
+
+def get_columns_to_load(config_df: DF, data_columns) -> list:
+    """The data columns that are in the config, in the order they appear in the data"""
+    config_fields = set(config_df.index)
+    load_columns = [column for column in data_columns if column in config_fields]
+
+    pruned_columns = [column for column in data_columns if column not in config_fields]
+    if pruned_columns:
+        log.info(f"Fields not in config, and not loaded: {pruned_columns}")
+
+    return load_columns
+
+
+def read_data_columns(data_filepath: str, load_columns: list) -> DF:
+    """Reads the data, only parsing the columns that will be loaded"""
+    import pandas as pd
+
+    return pd.read_csv(data_filepath, usecols=load_columns)
+
+
+def get_column_positions(data_filepath: str, load_columns: list) -> list:
+    """The positions of `load_columns` in the csv, in the order they're loaded
+
+    Positions come from the header pandas reads (read_data_header), since `load_columns` are
+    pandas' column names: a byte order mark is stripped, and duplicate names are renamed
+    (a second 'id' becomes 'id.1').
+    """
+    data_columns = list(read_data_header(data_filepath).columns)
+    positions = {column: position for position, column in enumerate(data_columns)}
+
+    return [positions[column] for column in load_columns]
+
+
+def project_csv_rows(reader, positions: list, field_count: int):
+    """Yields the values at `positions` from each row of a csv.reader, reading rows as pandas does
+
+    Blank (or whitespace-only) lines are skipped, and rows with fewer than `field_count` fields
+    are padded with empty values, so the rows match the ones that were validated.
+    """
+    for row in reader:
+        if not row or (len(row) == 1 and not row[0].strip()):
+            continue
+        if len(row) < field_count:
+            row += [""] * (field_count - len(row))
+        yield [row[position] for position in positions]
+
+
+def write_projected_csv(data_filepath: str, load_columns: list, out_filepath: str):
+    """Copies the csv with only `load_columns`, passing values through as-is (no type parsing)"""
+    positions = get_column_positions(data_filepath, load_columns)
+    # utf-8-sig drops a byte order mark, as pandas does
+    with open(data_filepath, newline="", encoding="utf-8-sig") as infile, open(
+        out_filepath, "w", newline="", encoding="utf-8"
+    ) as outfile:
+        reader = csv.reader(infile)
+        writer = csv.writer(outfile)
+        header = next(reader)
+
+        writer.writerow(load_columns)
+        writer.writerows(project_csv_rows(reader, positions, len(header)))
+
+    log.info(f"Wrote {len(load_columns)} of {len(header)} columns to {out_filepath}")
+
+
+def split_csv_into_parts(
+    data_filepath: str,
+    load_columns: list,
+    out_directory: str,
+    part_target_bytes: int,
+) -> list:
+    """Splits the csv into part-N.csv files of about `part_target_bytes` each, with the header in every part
+
+    Only `load_columns` are kept, and values pass through as-is (no type parsing).
+    """
+    out_directory = ensure_file_slash(out_directory)
+    make_dir_if_not_exists(out_directory)
+    positions = get_column_positions(data_filepath, load_columns)
+    part_filenames = []
+
+    # utf-8-sig drops a byte order mark, as pandas does
+    with open(data_filepath, newline="", encoding="utf-8-sig") as infile:
+        reader = csv.reader(infile)
+        header = next(reader)
+
+        outfile = None
+        part_size = 0
+        for values in project_csv_rows(reader, positions, len(header)):
+            # Start a new part when there isn't one yet, or the current one is full
+            if outfile is None or part_size >= part_target_bytes:
+                if outfile is not None:
+                    outfile.close()
+                part_filename = f"part-{len(part_filenames)}.csv"
+                part_filenames.append(part_filename)
+                outfile = open(
+                    out_directory + part_filename, "w", newline="", encoding="utf-8"
+                )
+                writer = csv.writer(outfile)
+                part_size = writer.writerow(load_columns)
+            part_size += writer.writerow(values)
+
+        if outfile is not None:
+            outfile.close()
+
+    # A header-only file still gets a (header-only) part
+    if not part_filenames:
+        part_filenames.append("part-0.csv")
+        with open(
+            out_directory + "part-0.csv", "w", newline="", encoding="utf-8"
+        ) as outfile:
+            csv.writer(outfile).writerow(load_columns)
+
+    return part_filenames
+
+
+def upload_partitioned_data(
+    s3_connection,
+    parts_folder: str,
+    part_filenames: list,
+    partition: str,
+    table: str,
+    temp_folder: str,
+) -> dict:
+    """Uploads the parts (see split_csv_into_parts) as <table>/<partition>/part-N.csv, then points <table>/_manifest.json at them
+
+    Readers can then find the latest data with a single GET of the manifest, instead of
+    listing the whole table prefix.
+    """
+    metrics.inc(
+        "bytes_uploaded",
+        sum(os.path.getsize(parts_folder + part) for part in part_filenames),
+    )
+
+    # The parts are independent, so upload them in parallel
+    s3_partition_path = f"{table}/{partition}"
+    with ThreadPoolExecutor(max_workers=S3_UPLOAD_WORKERS) as executor:
+        uploads = [
+            executor.submit(
+                move_local_file_to_s3,
+                s3_connection,
+                part_filename,
+                parts_folder,
+                S3_BUCKET,
+                part_filename,
+                s3_partition_path,
+            )
+            for part_filename in part_filenames
+        ]
+        for upload in uploads:
+            upload.result()
+
+    # The manifest goes last, so it never points at parts that aren't there yet
+    manifest = {
+        "table": table,
+        "config": f"{table}/config.json",
+        "latest_partition": partition,
+        "latest_parts": [
+            f"{s3_partition_path}/{part_filename}" for part_filename in part_filenames
+        ],
+        "updated_at": dt.now().isoformat(timespec="seconds"),
+    }
+    with open(temp_folder + MANIFEST_FILENAME, "w") as outfile:
+        json.dump(manifest, outfile)
+    move_local_file_to_s3(
+        s3_connection,
+        MANIFEST_FILENAME,
+        temp_folder,
+        S3_BUCKET,
+        s3_path=table,
+    )
+    log.info(f"Updated '{table}/{MANIFEST_FILENAME}' to point at '{partition}'")
+
+    return manifest
+
+
 if __name__ == "__main__":
     # Initiate logging
     from library.log_config import get_logger
 
     log = get_logger(__name__)
-    config_update = False
-
-    staging_s3 = yes_true_else_false(
-        "Do you want to load the default AWS profile to load a CSV that will populate an MSP table?"
-    )
-    if staging_s3:
-        s3_connection = connect_to_aws_service(AWS_ACCOUNT_ID, AWS_ROLE_NAME)
-    else:
-        aws_account_id = ensure_not_blank("Enter the AWS Account ID: ")
-        aws_role_name = ensure_not_blank("Enter the AWS Role Name: ")
-        s3_connection = connect_to_aws_service(aws_account_id, aws_role_name)
-
-    # Ensure file exists
-    data_filename, data_directory, data_filepath = ensure_file_exists(
-        f"What is the name of the csv of data you would like to load to the database?",
-        "Where is the file located?",
-        DEFAULT_CSV_LOCATION,
-    )
-    data_as_df = pd.read_csv(data_filepath)
+    metrics = RunMetrics("load_to_staging_s3", METRICS_FILE)
 
-    # Add temp folder to store config.json
-    temp_folder = ensure_file_slash(data_directory + "temp")
-    make_dir_if_not_exists(temp_folder)
+    with metrics.record_run():
+        config_update = False
+        # The config.json pulled from S3 (if any), so changes to it can be migrated in place
+        s3_config_df = None
 
-    # Append date to end of file for name in the S3
-    date_appendix = dt.now().strftime("_%Y%m%d.csv")
-    new_filename = data_filename[:-4] + date_appendix
+        staging_s3 = yes_true_else_false(
+            "Do you want to load the default AWS profile to load a CSV that will populate an MSP table?"
+        )
+        # boto3 (via the AWS/S3 utils) is only imported once the first prompt is answered
+        from library.connection_utils import connect_to_aws_service
+        from library.s3_utils import (
+            check_if_folder_exists_in_s3_bucket,
+            move_local_file_to_s3,
+            pull_file_from_s3,
+            create_directory_in_s3,
+        )
 
-    # Loop until the user determines the desired table to import to, and the import succeeds.
-    while True:
-        # Default table name = same as filename (without .csv)
-        if data_filename[-4:] == ".csv":
-            table_guess = data_filename[:-4]
-            table = enter_for_default("What is the table name?", table_guess)
+        if staging_s3:
+            s3_connection = connect_to_aws_service(AWS_ACCOUNT_ID, AWS_ROLE_NAME)
         else:
-            table = enter_for_default("What is the table name?", data_filename)
+            aws_account_id = ensure_not_blank("Enter the AWS Account ID: ")
+            aws_role_name = ensure_not_blank("Enter the AWS Role Name: ")
+            s3_connection = connect_to_aws_service(aws_account_id, aws_role_name)
+
+        # Ensure file exists
+        data_filename, data_directory, data_filepath = ensure_file_exists(
+            f"What is the name of the csv of data you would like to load to the database?",
+            "Where is the file located?",
+            DEFAULT_CSV_LOCATION,
+        )
+        # Only the header is read for now. The data is read once the config decides which columns are needed.
+        data_header_df = read_data_header(data_filepath)
 
-        # Check if directory exists in s3
-        if check_if_folder_exists_in_s3_bucket(s3_connection, S3_BUCKET, table):
-            intended = yes_true_else_false(
-                f"The table `{table}` already exists. Was this expected?",
-            )
+        # Add temp folder to store config.json
+        temp_folder = ensure_file_slash(data_directory + "temp")
+        make_dir_if_not_exists(temp_folder)
+
+        # Append date to end of file for name in the S3
+        date_appendix = dt.now().strftime("_%Y%m%d.csv")
+        new_filename = data_filename[:-4] + date_appendix
+
+        # Loop until the user determines the desired table to import to, and the import succeeds.
+        while True:
+            # Default table name = same as filename (without .csv)
+            if data_filename[-4:] == ".csv":
+                table_guess = data_filename[:-4]
+                table = enter_for_default("What is the table name?", table_guess)
+            else:
+                table = enter_for_default("What is the table name?", data_filename)
 
-            # The table exists AND they knew it existed
-            if intended:
-                # Loop until config.json matches and is loaded to S3
-                while True:
-                    try:
-                        # Pull config.json from S3
-                        config_exists = pull_file_from_s3(
-                            s3_connection, S3_BUCKET, "config.json", table, temp_folder
-                        )
-                        # If config.json doesn't exist in the directory for some reason, raise error
-                        if not config_exists:
-                            raise AssertionError(
-                                f"config.json does not exist for '{table}'"
+            # Check if directory exists in s3
+            if check_if_folder_exists_in_s3_bucket(s3_connection, S3_BUCKET, table):
+                intended = yes_true_else_false(
+                    f"The table `{table}` already exists. Was this expected?",
+                )
+
+                # The table exists AND they knew it existed
+                if intended:
+                    # Loop until config.json matches and is loaded to S3
+                    while True:
+                        try:
+                            # Pull config.json from S3
+                            config_exists = pull_file_from_s3(
+                                s3_connection,
+                                S3_BUCKET,
+                                "config.json",
+                                table,
+                                temp_folder,
                             )
+                            # If config.json doesn't exist in the directory for some reason, raise error
+                            if not config_exists:
+                                raise AssertionError(
+                                    f"config.json does not exist for '{table}'"
+                                )
 
-                        # Expand config.json into DF
-                        with open(temp_folder + "config.json", "r") as json_file:
-                            config_json = json.load(json_file)
-
-                        # Convert JSON to DF for easier comparison
-                        config_df = create_relational_config_from_json(
-                            config_json, True, temp_folder
-                        )
-
-                        # Show the current configuration so the user knows if it needs to be updated
-                        log.info(
-                            f"The current configuration pulled from S3:\n{config_df}"
-                        )
-                        # Does the user want to update the config?
-                        update_config = yes_true_else_false(
-                            "Do you have an updated config file?"
-                        )
-
-                        if update_config:
-                            # Read in config.csv as config_df and compare to data
-                            config_df = choose_config_csv_and_compare_to_data_cols(
-                                data_as_df
+                            # Expand config.json into DF
+                            with open(temp_folder + "config.json", "r") as json_file:
+                                config_json = json.load(json_file)
+
+                            # Convert JSON to DF for easier comparison
+                            config_df = create_relational_config_from_json(
+                                config_json, True, temp_folder
                             )
-                            break
-                        else:
-                            # Compare config fields to data fields
-                            (
-                                config_only_cols,
-                                data_only_cols,
-                            ) = compare_config_to_data_cols(config_df, data_as_df)
-
-                            # The config and existing data definitions did not line up one or more lists won't be empty
-                            if config_only_cols or data_only_cols:
-                                # Fields exist in config but not in data
-                                print("\nThe table config needs to be updated!")
-
-                                while True:
-                                    edit_replace = input(
-                                        "Do you want to (R)eplace the config by uploading a new one, or (E)dit the existing config in-place? "
-                                    )
+                            s3_config_df = config_df.copy()
 
-                                    # They want to replace the existing config.json entirely
-                                    if edit_replace.lower() in ("replace", "r"):
-                                        edit_replace = "replace"
-                                        break
-                                    # They want to edit the existing config.json.
-                                    elif edit_replace.lower() in ("edit", "e"):
-                                        edit_replace = "edit"
-                                        break
-
-                                if edit_replace == "edit":
-                                    # Fields exist in config but not data
-                                    if config_only_cols:
-                                        log.info(
-                                            f"Fields in existing config not in current data upload: {config_only_cols}"
+                            # Show the current configuration so the user knows if it needs to be updated
+                            log.info(
+                                f"The current configuration pulled from S3:\n{config_df}"
+                            )
+                            # Does the user want to update the config?
+                            update_config = yes_true_else_false(
+                                "Do you have an updated config file?"
+                            )
+
+                            if update_config:
+                                # Read in config.csv as config_df and compare to data
+                                config_df = choose_config_csv_and_compare_to_data_cols(
+                                    data_header_df
+                                )
+                                break
+                            else:
+                                # Compare config fields to data fields
+                                (
+                                    config_only_cols,
+                                    data_only_cols,
+                                ) = compare_config_to_data_cols(
+                                    config_df, data_header_df
+                                )
+
+                                # The config and existing data definitions did not line up one or more lists won't be empty
+                                if config_only_cols or data_only_cols:
+                                    # Fields exist in config but not in data
+                                    print("\nThe table config needs to be updated!")
+
+                                    while True:
+                                        edit_replace = input(
+                                            "Do you want to (R)eplace the config by uploading a new one, or (E)dit the existing config in-place? "
                                         )
-                                        # Can only remove fields, or leave them.
-                                        for field in config_only_cols:
-                                            remove = yes_true_else_false(
-                                                f"Do you want to remove '{field}' from the config?"
+
+                                        # They want to replace the existing config.json entirely
+                                        if edit_replace.lower() in ("replace", "r"):
+                                            edit_replace = "replace"
+                                            break
+                                        # They want to edit the existing config.json.
+                                        elif edit_replace.lower() in ("edit", "e"):
+                                            edit_replace = "edit"
+                                            break
+
+                                    if edit_replace == "edit":
+                                        # Fields exist in config but not data
+                                        if config_only_cols:
+                                            log.info(
+                                                f"Fields in existing config not in current data upload: {config_only_cols}"
                                             )
-                                            if remove:
-                                                config_df.drop(
-                                                    axis=0, index=field, inplace=True
+                                            # Can only remove fields, or leave them.
+                                            for field in config_only_cols:
+                                                remove = yes_true_else_false(
+                                                    f"Do you want to remove '{field}' from the config?"
                                                 )
+                                                if remove:
+                                                    config_df.drop(
+                                                        axis=0,
+                                                        index=field,
+                                                        inplace=True,
+                                                    )
 
-                                    # Fields exist in data but not in config
-                                    if data_only_cols:
-                                        log.info(
-                                            f"Fields in data upload not in existing config: {data_only_cols}"
+                                        # Fields exist in data but not in config
+                                        if data_only_cols:
+                                            log.info(
+                                                f"Fields in data upload not in existing config: {data_only_cols}"
+                                            )
+                                            # Define the config for the new fields
+                                            for field in data_only_cols:
+                                                # Fields left out of the config aren't read, validated or uploaded
+                                                if not yes_true_else_false(
+                                                    f"Do you want to add '{field}' to the config? If not, it won't be uploaded."
+                                                ):
+                                                    continue
+                                                print(
+                                                    f"Enter the details for the field {field}: "
+                                                )
+                                                # Ensure it's an allowed datatype
+                                                while True:
+                                                    datatype = input(
+                                                        "Datatype: "
+                                                    ).lower()
+                                                    if datatype in ALLOWED_DATA_TYPES:
+                                                        break
+                                                    else:
+                                                        log.warning(
+                                                            f"The only allowed datatypes are: {ALLOWED_DATA_TYPES}"
+                                                        )
+                                                nulls_allowed = yes_true_else_false(
+                                                    "Are nulls allowed?: "
+                                                )
+                                                is_primary = yes_true_else_false(
+                                                    "Is this part of the primary key?: "
+                                                )
+                                                new_row = {
+                                                    "type": datatype,
+                                                    "null": nulls_allowed,
+                                                    "primary": is_primary,
+                                                }
+                                                # Add row to the existing config DF
+                                                config_df.loc[field] = new_row
+
+                                        # List primary fields
+                                        primary_df = config_df[
+                                            config_df["primary"] == True
+                                        ]
+                                        print(
+                                            f"The current primary field(s) are:\n{primary_df} "
                                         )
-                                        # Define the config for the new fields
-                                        for field in data_only_cols:
+                                        # Does the user want to change the primary fields?
+                                        change_primaries = yes_true_else_false(
+                                            "Do you want to make changes to the primary field(s)?"
+                                        )
+                                        if change_primaries:
+                                            print(
+                                                "Please type the desired primary fields one at a time.\nUse Ctrl+C to exit when you're done. "
+                                            )
+                                            primary_options = config_df.index.tolist()
                                             print(
-                                                f"Enter the details for the field {field}: "
+                                                f"Here are your options for primary fields:\n{primary_options}"
                                             )
-                                            # Ensure it's an allowed datatype
+                                            new_primaries = []
+                                            # Continue looping until keyboard interrupt
                                             while True:
-                                                datatype = input("Datatype: ").lower()
-                                                if datatype in ALLOWED_DATA_TYPES:
+                                                try:
+                                                    new_prim = input("Primary field: ")
+                                                    if new_prim in primary_options:
+                                                        new_primaries.append(new_prim)
+                                                    else:
+                                                        log.warning(
+                                                            f"{new_prim} is not in the fields list"
+                                                        )
+                                                except KeyboardInterrupt:
                                                     break
-                                                else:
-                                                    log.warning(
-                                                        f"The only allowed datatypes are: {ALLOWED_DATA_TYPES}"
-                                                    )
-                                            nulls_allowed = yes_true_else_false(
-                                                "Are nulls allowed?: "
+
+                                            config_df.drop("primary", axis=1)
+                                            config_df["primary"] = False
+                                            config_df.loc[
+                                                config_df.index.isin(new_primaries),
+                                                "primary",
+                                            ] = True
+                                            print(
+                                                f"The now-current primary field(s) are:\n{primary_df} "
                                             )
-                                            is_primary = yes_true_else_false(
-                                                "Is this part of the primary key?: "
+                                    # Replace the existing table with the new data, regardless of the columns.
+                                    elif edit_replace == "replace":
+                                        config_df = (
+                                            choose_config_csv_and_compare_to_data_cols(
+                                                data_header_df
                                             )
-                                            new_row = {
-                                                "type": datatype,
-                                                "null": nulls_allowed,
-                                                "primary": is_primary,
-                                            }
-                                            # Add row to the existing config DF
-                                            config_df.loc[field] = new_row
-
-                                    # List primary fields
-                                    primary_df = config_df[config_df["primary"] == True]
-                                    print(
-                                        f"The current primary field(s) are:\n{primary_df} "
-                                    )
-                                    # Does the user want to change the primary fields?
-                                    change_primaries = yes_true_else_false(
-                                        "Do you want to make changes to the primary field(s)?"
-                                    )
-                                    if change_primaries:
-                                        print(
-                                            "Please type the desired primary fields one at a time.\nUse Ctrl+C to exit when you're done. "
-                                        )
-                                        primary_options = config_df.index.tolist()
-                                        print(
-                                            f"Here are your options for primary fields:\n{primary_options}"
-                                        )
-                                        new_primaries = []
-                                        # Continue looping until keyboard interrupt
-                                        while True:
-                                            try:
-                                                new_prim = input("Primary field: ")
-                                                if new_prim in primary_options:
-                                                    new_primaries.append(new_prim)
-                                                else:
-                                                    log.warning(
-                                                        f"{new_prim} is not in the fields list"
-                                                    )
-                                            except KeyboardInterrupt:
-                                                break
-
-                                        config_df.drop("primary", axis=1)
-                                        config_df["primary"] = False
-                                        config_df.loc[
-                                            config_df.index.isin(new_primaries),
-                                            "primary",
-                                        ] = True
-                                        print(
-                                            f"The now-current primary field(s) are:\n{primary_df} "
-                                        )
-                                # Replace the existing table with the new data, regardless of the columns.
-                                elif edit_replace == "replace":
-                                    config_df = (
-                                        choose_config_csv_and_compare_to_data_cols(
-                                            data_as_df
                                         )
+                                    break
+                                else:
+                                    log.info(
+                                        f"Fields from config.json and {data_filename} match"
                                     )
+                                    break
+                        except AssertionError as e:
+                            # There was no config.json in the S3 directory
+                            log.error(
+                                f"There was no config.json in '{table}' in '{S3_BUCKET}'"
+                            )
+                            have_config = yes_true_else_false(
+                                "Do you have a config to upload?"
+                            )
+                            # They have a config.csv that they want to upload
+                            if have_config:
+                                config_df = choose_config_csv_and_compare_to_data_cols(
+                                    data_header_df
+                                )
                                 break
                             else:
-                                log.info(
-                                    f"Fields from config.json and {data_filename} match"
+                                raise FileNotFoundError(
+                                    "Please create a config.csv file that matches your data schema and then try again."
                                 )
-                                break
-                    except AssertionError as e:
-                        # There was no config.json in the S3 directory
-                        log.error(
-                            f"There was no config.json in '{table}' in '{S3_BUCKET}'"
-                        )
-                        have_config = yes_true_else_false(
-                            "Do you have a config to upload?"
-                        )
-                        # They have a config.csv that they want to upload
-                        if have_config:
-                            config_df = choose_config_csv_and_compare_to_data_cols(
-                                data_as_df
-                            )
-                            break
-                        else:
-                            raise FileNotFoundError(
-                                "Please create a config.csv file that matches your data schema and then try again."
-                            )
-                    except Exception as e:
-                        print(f"{type(e)}: {e}")
-                break
-        # If the table name is blank, start over
-        elif table == "":
-            pass
-        # A table with that name does not yet exist
+                        except Exception as e:
+                            print(f"{type(e)}: {e}")
+                    break
+            # If the table name is blank, start over
+            elif table == "":
+                pass
+            # A table with that name does not yet exist
+            else:
+                # Did they intend to create a new table? If not, go back to start of loop.
+                intended = yes_true_else_false(
+                    f"A new table, '{table}' will be created. Ready to continue?"
+                )
+
+                # They intended to create a new table, create new table.
+                if intended:
+                    # Create directory in S3 (needs to be done due to flat file structure)
+                    create_directory_in_s3(s3_connection, S3_BUCKET, table)
+
+                    # Read in config.csv as config_df
+                    config_df = choose_config_csv_and_compare_to_data_cols(
+                        data_header_df
+                    )
+                    break
+
+        # Do validation on the config and give them an opportunity to fix schema
+        config_df = find_invalid_config_rows_and_fix(config_df, table, data_directory)
+
+        metrics.table = table
+
+        # Only the data columns in the config are parsed, validated and uploaded
+        load_columns = get_columns_to_load(config_df, data_header_df.columns)
+
+        # Check a sample of the data before reading, validating and uploading all of it
+        if PREFLIGHT_SAMPLING:
+            with metrics.time_stage("preflight"):
+                preflight_passed = preflight_check_data(
+                    data_filepath, load_columns, config_df
+                )
         else:
-            # Did they intend to create a new table? If not, go back to start of loop.
-            intended = yes_true_else_false(
-                f"A new table, '{table}' will be created. Ready to continue?"
+            preflight_passed = True
+        if not preflight_passed:
+            shutil.rmtree(temp_folder)
+            sys.exit(
+                "Stopped after the pre-flight check. Fix the data or config and try again."
             )
 
-            # They intended to create a new table, create new table.
-            if intended:
-                # Create directory in S3 (needs to be done due to flat file structure)
-                create_directory_in_s3(s3_connection, S3_BUCKET, table)
+        with metrics.time_stage("read"):
+            data_as_df = read_data_columns(data_filepath, load_columns)
+        metrics.inc("rows_read", len(data_as_df.index))
+        metrics.inc("bytes_read", os.path.getsize(data_filepath))
+
+        # Check the datatypes in the config file vs. what exists in the table data.
+        with metrics.time_stage("validate"):
+            failure_df = create_data_schema_and_validate_data_dtypes(
+                data_as_df, config_df, table, data_directory
+            )
+        metrics.inc("validation_failures", len(failure_df.index))
+
+        # Write the ALTER TABLE statements that take the table from the old config to the new one
+        migration_filename = None
+        if s3_config_df is not None:
+            migration_filename = create_migration_from_config_drift(
+                s3_config_df,
+                config_df,
+                table,
+                temp_folder,
+                "migration" + dt.now().strftime("_%Y%m%d.sql"),
+            )
 
-                # Read in config.csv as config_df
-                config_df = choose_config_csv_and_compare_to_data_cols(data_as_df)
-                break
+        # Write the data files before anything is uploaded, so a failure here leaves S3 untouched.
+        # If columns were pruned, the upload is a copy with only the loaded columns.
+        upload_filename, upload_directory, upload_filepath = (
+            data_filename,
+            data_directory,
+            data_filepath,
+        )
+        with metrics.time_stage("prepare_upload"):
+            if S3_PARTITIONED_LAYOUT:
+                # Every run gets its own partition, so a later run the same day never mixes
+                # its parts with leftover parts from an earlier one
+                partition = dt.now().strftime("dt=%Y-%m-%d/run=%H%M%S")
+                parts_folder = ensure_file_slash(temp_folder + "parts")
+                part_filenames = split_csv_into_parts(
+                    data_filepath,
+                    load_columns,
+                    parts_folder,
+                    S3_PART_TARGET_MB * 1024 * 1024,
+                )
+                log.info(
+                    f"Split data into {len(part_filenames)} part(s) for '{partition}'"
+                )
+            elif len(load_columns) < len(data_header_df.columns):
+                write_projected_csv(
+                    data_filepath, load_columns, temp_folder + new_filename
+                )
+                upload_filename, upload_directory, upload_filepath = (
+                    new_filename,
+                    temp_folder,
+                    temp_folder + new_filename,
+                )
 
-    # Do validation on the config and give them an opportunity to fix schema
-    config_df = find_invalid_config_rows_and_fix(config_df, table, data_directory)
+        # Create new config.json from config_df
+        config_json = create_config_json_from_df(config_df, True, temp_folder)
 
-    # Check the datatypes in the config file vs. what exists in the table data.
-    create_data_schema_and_validate_data_dtypes(
-        data_as_df, config_df, table, data_directory
-    )
+        # Load config.json to S3
+        move_local_file_to_s3(
+            s3_connection,
+            "config.json",
+            temp_folder,
+            S3_BUCKET,
+            s3_path=table,
+        )
 
-    # Create new config.json from config_df
-    config_json = create_config_json_from_df(config_df, True, temp_folder)
+        # Load the migration to S3 next to config.json
+        if migration_filename:
+            move_local_file_to_s3(
+                s3_connection,
+                migration_filename,
+                temp_folder,
+                S3_BUCKET,
+                s3_path=table,
+            )
 
-    # Load config.json to S3
-    move_local_file_to_s3(
-        s3_connection,
-        "config.json",
-        temp_folder,
-        S3_BUCKET,
-        s3_path=table,
-    )
+        # Load table data to S3
+        with metrics.time_stage("upload"):
+            if S3_PARTITIONED_LAYOUT:
+                upload_partitioned_data(
+                    s3_connection,
+                    parts_folder,
+                    part_filenames,
+                    partition,
+                    table,
+                    temp_folder,
+                )
+            else:
+                metrics.inc("bytes_uploaded", os.path.getsize(upload_filepath))
+                move_local_file_to_s3(
+                    s3_connection,
+                    upload_filename,
+                    upload_directory,
+                    S3_BUCKET,
+                    new_filename,
+                    table,
+                )
+        metrics.inc("rows_written", len(data_as_df.index))
 
-    # Load table data to S3
-    move_local_file_to_s3(
-        s3_connection,
-        data_filename,
-        data_directory,
-        S3_BUCKET,
-        new_filename,
-        table,
-    )
-    # Delete temp_folder
-    shutil.rmtree(temp_folder)
+        # Delete temp_folder
+        shutil.rmtree(temp_folder)
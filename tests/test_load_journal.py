@@ -0,0 +1,170 @@
+"""Tests for load_to_db/load_journal.py. From the root of the repo: python -m pytest tests"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "load_to_db"
+    )
+)
+
+from load_journal import (
+    find_unfinished_load,
+    finish_load,
+    open_load_journal,
+    record_chunk,
+    rows_loaded_into_table,
+    start_load,
+    summarize_load,
+)
+
+CHUNK_SIZE = 10
+FILE_ROWS = 25
+TABLE_ROWS_BEFORE = 100
+
+
+@pytest.fixture
+def journal():
+    journal = open_load_journal(":memory:")
+    yield journal
+    journal.close()
+
+
+def start_append(journal, fingerprint="fp", target="schema.table"):
+    return start_load(
+        journal,
+        fingerprint,
+        "file.csv",
+        target,
+        "append",
+        CHUNK_SIZE,
+        TABLE_ROWS_BEFORE,
+    )
+
+
+def test_record_chunk_numbers_chunks_per_load(journal):
+    load_id = start_append(journal)
+    other_load_id = start_append(journal, target="schema.other")
+    record_chunk(journal, load_id, 0, 10, 0.5)
+    record_chunk(journal, other_load_id, 0, 10, 0.5)
+    record_chunk(journal, load_id, 10, 10, 0.25)
+
+    chunks = journal.execute(
+        "SELECT chunk_index, row_offset FROM chunks WHERE load_id = ? ORDER BY chunk_index",
+        (load_id,),
+    ).fetchall()
+    assert [tuple(chunk) for chunk in chunks] == [(0, 0), (1, 10)]
+
+    summary = summarize_load(journal, load_id)
+    assert summary["chunk_count"] == 2
+    assert summary["row_count"] == 20
+    assert summary["seconds"] == 0.75
+
+
+def test_find_unfinished_load(journal):
+    load_id = start_append(journal)
+    record_chunk(journal, load_id, 0, 10, 0.5)
+    record_chunk(journal, load_id, 10, 10, 0.5)
+
+    unfinished = find_unfinished_load(journal, "fp", "schema.table")
+    assert unfinished["id"] == load_id
+    assert unfinished["rows_committed"] == 20
+    assert unfinished["chunk_size"] == CHUNK_SIZE
+    assert unfinished["table_rows_before"] == TABLE_ROWS_BEFORE
+
+    assert find_unfinished_load(journal, "other fp", "schema.table") is None
+    assert find_unfinished_load(journal, "fp", "schema.other") is None
+
+
+def test_find_unfinished_load_without_chunks(journal):
+    load_id = start_append(journal)
+
+    assert find_unfinished_load(journal, "fp", "schema.table")["rows_committed"] == 0
+    finish_load(journal, load_id, "abandoned")
+    assert find_unfinished_load(journal, "fp", "schema.table") is None
+
+
+def test_find_unfinished_load_returns_latest(journal):
+    finish_load(journal, start_append(journal))
+    start_append(journal)
+    latest_id = start_append(journal)
+
+    assert find_unfinished_load(journal, "fp", "schema.table")["id"] == latest_id
+
+
+def unfinished_after_one_chunk(journal):
+    load_id = start_append(journal)
+    record_chunk(journal, load_id, 0, CHUNK_SIZE, 0.5)
+    return find_unfinished_load(journal, "fp", "schema.table")
+
+
+def test_rows_loaded_into_table_matches_journal(journal):
+    unfinished = unfinished_after_one_chunk(journal)
+
+    assert rows_loaded_into_table(unfinished, TABLE_ROWS_BEFORE + 10, FILE_ROWS) == 10
+
+
+def test_rows_loaded_into_table_one_chunk_ahead(journal):
+    # The second chunk was committed to the table, but the crash came before it was journaled
+    unfinished = unfinished_after_one_chunk(journal)
+
+    assert rows_loaded_into_table(unfinished, TABLE_ROWS_BEFORE + 20, FILE_ROWS) == 20
+
+
+def test_rows_loaded_into_table_final_short_chunk_ahead(journal):
+    load_id = start_append(journal)
+    record_chunk(journal, load_id, 0, 10, 0.5)
+    record_chunk(journal, load_id, 10, 10, 0.5)
+    unfinished = find_unfinished_load(journal, "fp", "schema.table")
+
+    assert rows_loaded_into_table(unfinished, TABLE_ROWS_BEFORE + 25, FILE_ROWS) == 25
+
+
+@pytest.mark.parametrize(
+    "rows_in_table",
+    [
+        5,  # rows were deleted from the table
+        13,  # other rows were written, fewer than a chunk
+        30,  # more than one chunk ahead
+    ],
+)
+def test_rows_loaded_into_table_foreign_rows(journal, rows_in_table):
+    unfinished = unfinished_after_one_chunk(journal)
+
+    assert (
+        rows_loaded_into_table(unfinished, TABLE_ROWS_BEFORE + rows_in_table, FILE_ROWS)
+        is None
+    )
+
+
+def test_open_load_journal_adds_table_rows_before(tmp_path):
+    # Journals written before table_rows_before was recorded
+    journal_path = str(tmp_path / "load_journal.sqlite")
+    journal = sqlite3.connect(journal_path)
+    journal.execute(
+        """
+        CREATE TABLE loads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fingerprint TEXT NOT NULL,
+            filepath TEXT NOT NULL,
+            target TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    journal.execute(
+        "INSERT INTO loads VALUES (1, 'fp', 'file.csv', 'schema.table', 'append', 10, 'in_progress', '', '')"
+    )
+    journal.commit()
+    journal.close()
+
+    journal = open_load_journal(journal_path)
+    assert find_unfinished_load(journal, "fp", "schema.table")["table_rows_before"] == 0
+    journal.close()
@@ -0,0 +1,84 @@
+"""Tests for library/schema_drift.py. From the root of the repo: python -m pytest tests"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library.schema_drift import diff_configs, generate_alter_statements
+
+OLD_FIELDS = {
+    "id": ("int", False, True),
+    "name": ("varchar", True, False),
+    "amount": ("int", True, False),
+    "legacy": ("varchar", True, False),
+}
+
+
+def test_diff_configs_no_changes():
+    config_diff = diff_configs(OLD_FIELDS, dict(OLD_FIELDS))
+
+    assert config_diff.is_empty()
+    assert generate_alter_statements(config_diff, "orders") == []
+
+
+def test_diff_configs_finds_every_kind_of_change():
+    new_fields = {
+        "id": ("int", False, True),
+        "name": ("varchar", False, False),
+        "amount": ("float", True, False),
+        "created": ("datetime", True, False),
+    }
+    config_diff = diff_configs(OLD_FIELDS, new_fields)
+
+    assert config_diff.added == {"created": "datetime"}
+    assert config_diff.dropped == ["legacy"]
+    assert config_diff.type_changed == {"amount": ("int", "float")}
+    assert config_diff.nullability_changed == {"name": False}
+    assert not config_diff.primary_changed
+
+
+def test_diff_configs_primary_key_order_is_not_a_change():
+    old_fields = {"a": ("int", False, True), "b": ("int", False, True)}
+    new_fields = {"b": ("int", False, True), "a": ("int", False, True)}
+    config_diff = diff_configs(old_fields, new_fields)
+
+    assert not config_diff.primary_changed
+    assert config_diff.is_empty()
+
+
+def test_generate_alter_statements():
+    new_fields = {
+        "id": ("int", False, False),
+        "name": ("varchar", False, True),
+        "amount": ("float", True, False),
+        "created": ("datetime", True, False),
+    }
+    config_diff = diff_configs(OLD_FIELDS, new_fields)
+
+    assert generate_alter_statements(config_diff, "orders", "staging") == [
+        'ALTER TABLE "staging"."orders" DROP CONSTRAINT "orders_pkey";',
+        'ALTER TABLE "staging"."orders" DROP COLUMN "legacy";',
+        'ALTER TABLE "staging"."orders" ADD COLUMN "created" TIMESTAMP;',
+        'ALTER TABLE "staging"."orders" ALTER COLUMN "amount" TYPE DOUBLE PRECISION '
+        'USING "amount"::DOUBLE PRECISION;',
+        'ALTER TABLE "staging"."orders" ALTER COLUMN "name" SET NOT NULL;',
+        'ALTER TABLE "staging"."orders" ADD PRIMARY KEY ("name");',
+    ]
+
+
+def test_generate_alter_statements_quotes_identifiers():
+    config_diff = diff_configs({}, {'say "hi"': ("varchar", True, False)})
+
+    assert generate_alter_statements(config_diff, "my table") == [
+        'ALTER TABLE "my table" ADD COLUMN "say ""hi""" VARCHAR;'
+    ]
+
+
+def test_generate_alter_statements_new_primary_key_without_old_one():
+    old_fields = {"id": ("int", False, False)}
+    new_fields = {"id": ("int", False, True)}
+    config_diff = diff_configs(old_fields, new_fields)
+
+    assert generate_alter_statements(config_diff, "orders") == [
+        'ALTER TABLE "orders" ADD PRIMARY KEY ("id");'
+    ]